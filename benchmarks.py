@@ -0,0 +1,475 @@
+"""Benchmarks of the covid data, news, config & page serving hot paths
+
+Run with:
+    python benchmarks.py --output results.json
+and compare a later run against it with:
+    python benchmarks.py --compare results.json
+
+Nothing is requested from the Cov19API or the newsapi, the covid data is synthetic and
+the news is served by a stub http server on localhost. Every file is written to a
+temporary folder, so the config.json of the dashboard is never touched
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+#folder holding the dashboard, benchmarks run in a temporary folder so it is added to the path
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PACKAGE_DIR)
+
+import covid_data_handler
+import covid_news_handling
+from cache_handling import RESPONSE_CACHE
+from config_handling import CONFIG, ConfigStore
+from upstream_handling import BUDGETS, configure_budgets
+
+#default number of rows of the synthetic covid .csv files
+DEFAULT_ROWS = [1000, 10000, 100000, 1000000]
+#a benchmark is reported as a regression when it is this many times slower than the baseline
+DEFAULT_THRESHOLD = 1.25
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """
+    times repeated calls of a function, garbage collection is paused while timing
+
+    Parameters:
+        func: the function to time, called without arguments
+        repeat: number of timed calls
+        warmup: number of untimed calls made first
+
+    Returns:
+        timings(dict): min, median, mean, max & p95 duration of a call in seconds
+    """
+    for _ in range(warmup):
+        func()
+    durations = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    durations.sort()
+    return {"min_s": durations[0],
+            "median_s": statistics.median(durations),
+            "mean_s": statistics.fmean(durations),
+            "max_s": durations[-1],
+            "p95_s": durations[min(len(durations) - 1, int(len(durations) * 0.95))]}
+
+def write_covid_csv(filename: str, rows: int, seed: int = 0) -> None:
+    """
+    writes a synthetic .csv with the header & layout of a Cov19API response, most recent day
+    first. As in real data the most recent days have no figures yet
+
+    Parameters:
+        filename: path of the .csv
+        rows: number of days
+        seed: seed of the random figures, the same seed always gives the same file
+
+    Returns:
+        None
+    """
+    generator = random.Random(seed)
+    dates = np.datetime_as_string(np.datetime64("2022-01-01") - np.arange(rows)).tolist()
+    with open(filename, "w", encoding="utf-8") as csv_file:
+        csv_file.write(",".join(covid_data_handler.COVID_STRUCTURE) + "\n")
+        for day, date in enumerate(dates):
+            cases = "" if day < 2 else generator.randint(0, 500)
+            hospital = "" if day < 3 else generator.randint(0, 900)
+            deaths = "" if day < 12 else rows + 100000 - day
+            csv_file.write(f'{date},"Bristol, City of",{cases},{hospital},{deaths}\n')
+
+def read_csv_text(filename: str) -> str:
+    """
+    reads a whole .csv file into one string, as Cov19API.get_csv returns it
+
+    Parameters:
+        filename: path of the .csv
+
+    Returns:
+        csv_data(str): the contents of the file
+    """
+    with open(filename, "r", encoding="utf-8") as csv_file:
+        return csv_file.read()
+
+def split_covid_columns(filename: str) -> Dict[str, np.ndarray]:
+    """
+    parses every row of a synthetic .csv into the columns of parse_covid_csv_columns with a
+    plain str.split loop, the per row loop the columnar parser replaced. The figures are
+    counted from the end of each row, as str.split also splits the quoted area name
+
+    Parameters:
+        filename: path of a .csv written by write_covid_csv
+
+    Returns:
+        columns(dict): the same columns as parse_covid_csv_columns
+    """
+    dates, cases, hospital, deaths = [], [], [], []
+    with open(filename, "r", encoding="utf-8") as csv_file:
+        next(csv_file)
+        for line in csv_file:
+            fields = line.rstrip("\n").split(",")
+            dates.append(fields[0])
+            cases.append(fields[-3] or "nan")
+            hospital.append(fields[-2] or "nan")
+            deaths.append(fields[-1] or "nan")
+    return {"date": np.array(dates, dtype="datetime64[D]"),
+            "cases": np.array(cases, dtype=np.float64),
+            "hospital": np.array(hospital, dtype=np.float64),
+            "deaths": np.array(deaths, dtype=np.float64)}
+
+def bench_covid_csv(folder: str, sizes: List[int], repeat: int) -> List[Dict[str, Any]]:
+    """
+    times reading & processing synthetic covid .csv files of every size, through the list
+    based, streaming & columnar paths of covid_data_handler, and the per row str.split loop
+    the columnar path replaced
+
+    Parameters:
+        folder: folder the .csv files are written to
+        sizes: number of rows of each file
+        repeat: number of timed runs per file, reduced for files of over 100k rows
+
+    Returns:
+        results(list): one result per path & size
+    """
+    results = []
+    for rows in sizes:
+        filename = os.path.join(folder, f"covid_{rows}.csv")
+        write_covid_csv(filename, rows)
+        runs = repeat if rows <= 100000 else max(1, repeat // 5)
+        paths = {
+            "covid_csv.parse_process":
+                lambda: covid_data_handler.process_covid_csv_data(
+                    covid_data_handler.parse_csv_data(filename)),
+            "covid_csv.stream_process":
+                lambda: covid_data_handler.process_covid_csv_data(
+                    covid_data_handler.iter_csv_data(filename)),
+            "covid_csv.split_process":
+                lambda: covid_data_handler.process_covid_columns(split_covid_columns(filename)),
+            "covid_csv.columns_process":
+                lambda: covid_data_handler.process_covid_columns(
+                    covid_data_handler.parse_covid_csv_columns(read_csv_text(filename))),
+        }
+        for name, func in paths.items():
+            timings = measure(func, runs)
+            results.append({"name": name, "params": {"rows": rows}, "repeat": runs, **timings,
+                            "rows_per_s": rows / timings["median_s"]})
+        os.remove(filename)
+    return results
+
+class _StubNewsHandler(BaseHTTPRequestHandler):
+    """
+    answers newsapi top-headlines requests with a few articles per search term after a fixed
+    delay, standing in for https://newsapi.org/ so the news benchmark needs no network
+    """
+    #seconds each response is delayed by, to mimic the latency of the newsapi
+    delay = 0.02
+    articles_per_term = 20
+
+    def log_message(self, *args) -> None:
+        """requests are not logged, it would distort the timings"""
+
+    def do_GET(self) -> None:
+        """
+        answers a request with articles containing the search term
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        term = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        time.sleep(self.delay)
+        body = json.dumps({"status": "ok",
+                           "totalResults": self.articles_per_term,
+                           "articles": [{"title": f"{term} article {number}",
+                                         "content": f"content of {term} article {number} " * 10}
+                                        for number in range(self.articles_per_term)]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", f'"{term}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_stub_news_server(delay: float) -> ThreadingHTTPServer:
+    """
+    starts the stub newsapi on a free port of localhost in a background thread
+
+    Parameters:
+        delay: seconds each response is delayed by
+
+    Returns:
+        server(ThreadingHTTPServer): the running server, call shutdown() to stop it
+    """
+    _StubNewsHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubNewsHandler)
+    threading.Thread(target=server.serve_forever, name="stub-newsapi", daemon=True).start()
+    return server
+
+def _news_config(terms: str) -> Dict[str, Any]:
+    """
+    returns the config read by news_API_request, based on "config - Copy.json"
+
+    Parameters:
+        terms: space separated search terms
+
+    Returns:
+        config(dict): the template config with the given search terms
+    """
+    with open(os.path.join(PACKAGE_DIR, "config - Copy.json"), "r", encoding="utf-8") as json_file:
+        config = json.load(json_file)
+    config["news_API_request_terms"]["covidnews_API_key"] = "benchmark"
+    config["news_API_request_terms"]["url_args"]["Covid_terms"] = terms
+    config["Cache_news"] = "true"
+    config["Cache_updates"] = "true"
+    return config
+
+def bench_news(repeat: int, delay: float, term_counts: List[int]) -> List[Dict[str, Any]]:
+    """
+    times news_API_request against the stub newsapi, with an empty (cold) & a filled (warm)
+    response cache
+
+    Parameters:
+        repeat: number of timed requests per case
+        delay: seconds each stub response is delayed by
+        term_counts: numbers of search terms to request
+
+    Returns:
+        results(list): one result per case & number of terms
+    """
+    server = start_stub_news_server(delay)
+    original_url = covid_news_handling.NEWS_API_URL
+    covid_news_handling.NEWS_API_URL = f"http://127.0.0.1:{server.server_address[1]}/v2/top-headlines"
+    #the cold requests would use up the newsapi budget & be refused after the first few
+    original_budget = {"per_minute": BUDGETS["news"].per_minute, "per_day": BUDGETS["news"].per_day}
+    configure_budgets({"news": {"per_minute": 0, "per_day": 0}})
+    results = []
+    try:
+        for count in term_counts:
+            CONFIG.replace(_news_config(" ".join(f"term{number}" for number in range(count))))
+
+            def cold():
+                RESPONSE_CACHE.clear()
+                return covid_news_handling.news_API_request()
+
+            cases = {"news.request_cold": cold, "news.request_warm": covid_news_handling.news_API_request}
+            for name, func in cases.items():
+                timings = measure(func, repeat)
+                results.append({"name": name, "params": {"terms": count, "stub_delay_s": delay},
+                                "repeat": repeat, **timings})
+    finally:
+        covid_news_handling.NEWS_API_URL = original_url
+        configure_budgets({"news": original_budget})
+        RESPONSE_CACHE.clear()
+        server.shutdown()
+        server.server_close()
+    return results
+
+def bench_config(folder: str, repeat: int, changes: int) -> List[Dict[str, Any]]:
+    """
+    times config.json read/modify/write cycles, as done by every change before ConfigStore,
+    & through ConfigStore where changes are written in one flush
+
+    Parameters:
+        folder: folder the config file is written to
+        repeat: number of timed cycles per case
+        changes: number of changes made per cycle
+
+    Returns:
+        results(list): one result per case
+    """
+    filename = os.path.join(folder, "config.json")
+    config = _news_config("Covid COVID-19 coronavirus")
+    config["News_store"] = {"articles": [[f"title {number}", "content " * 40, 1600000000 + number]
+                                         for number in range(200)],
+                            "deleted": [f"{number:016x}" for number in range(2000)]}
+    with open(filename, "w", encoding="utf-8") as json_file:
+        json.dump(config, json_file)
+
+    def read_modify_write():
+        for change in range(changes):
+            with open(filename, "r", encoding="utf-8") as json_file:
+                data = json.load(json_file)
+            data["Missed_updates"] = "run" if change % 2 else "skip"
+            with open(filename, "w", encoding="utf-8") as json_file:
+                json.dump(data, json_file)
+
+    def config_store():
+        store = ConfigStore(filename)
+        for change in range(changes):
+            store.set("Missed_updates", "run" if change % 2 else "skip")
+        store.flush()
+
+    results = []
+    for name, func in {"config.read_modify_write": read_modify_write,
+                       "config.store_set_flush": config_store}.items():
+        timings = measure(func, repeat)
+        results.append({"name": name, "params": {"changes": changes,
+                                                 "bytes": os.path.getsize(filename)},
+                        "repeat": repeat, **timings})
+    return results
+
+def bench_index(folder: str, requests: int, articles: int) -> List[Dict[str, Any]]:
+    """
+    times requests to /index through Flask's test client, with the page cached, compressed,
+    answered with 304 Not Modified, and rendered again for every request
+
+    Parameters:
+        folder: folder the dashboard runs in, holding its config file
+        requests: number of timed requests per case
+        articles: number of news articles shown on the page
+
+    Returns:
+        results(list): one result per case, with throughput in requests per second
+    """
+    import ui
+
+    CONFIG.replace(_news_config("Covid COVID-19 coronavirus"))
+    CONFIG.filename = os.path.join(folder, "config.json")
+    CONFIG.flush()
+    ui.startup()
+    with ui.STATE_LOCK:
+        ui.NEWS_STORE.add_many({f"benchmark article {number}": "content " * 40
+                                for number in range(articles)})
+        ui.COVID_DATA = ui.MappingProxyType({
+            area: ui.MappingProxyType({"last7days_cases": 1234, "hospital_cases": 567, "deaths": 89})
+            for area in ui.TRACKED_AREAS})
+        ui.publish_state()
+    client = ui.app.test_client()
+    etag = client.get("/index").headers["ETag"]
+
+    def uncached():
+        ui.RENDERED_PAGES = (0, {})
+        client.get("/index")
+
+    cases = {"index.cached": lambda: client.get("/index"),
+             "index.gzip": lambda: client.get("/index", headers={"Accept-Encoding": "gzip"}),
+             "index.not_modified": lambda: client.get("/index", headers={"If-None-Match": etag}),
+             "index.render": uncached}
+    results = []
+    for name, func in cases.items():
+        timings = measure(func, requests, warmup=10)
+        results.append({"name": name, "params": {"articles": articles}, "repeat": requests,
+                        **timings, "requests_per_s": 1 / timings["mean_s"]})
+    return results
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> bool:
+    """
+    prints the median of every benchmark next to the baseline's & flags regressions
+
+    Parameters:
+        results: results of this run
+        baseline: output of an earlier run, read from its json file
+        threshold: ratio of medians above which a benchmark counts as a regression
+
+    Returns:
+        regressed(bool): True if any benchmark is slower than the baseline by more than threshold
+    """
+    def key(result):
+        return result["name"], json.dumps(result["params"], sort_keys=True)
+
+    previous = {key(result): result for result in baseline["results"]}
+    regressed = False
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        ratio = result["median_s"] / old["median_s"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{result['name']:<28} {key(result)[1]:<40} {old['median_s'] * 1000:>10.3f} ms"
+              f" -> {result['median_s'] * 1000:>10.3f} ms  x{ratio:.2f}{flag}")
+    return regressed
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    runs the selected benchmarks & writes their results as json
+
+    Parameters:
+        argv: command line arguments, sys.argv is used if None
+
+    Returns:
+        status(int): exit status, 1 if a regression against --compare was found
+    """
+    benchmarks = ["csv", "news", "config", "index"]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(benchmarks),
+                        help=f"comma separated benchmarks to run, from {benchmarks}")
+    parser.add_argument("--rows", default=",".join(map(str, DEFAULT_ROWS)),
+                        help="comma separated row counts of the synthetic covid .csv files")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per benchmark")
+    parser.add_argument("--requests", type=int, default=1000, help="timed requests per /index case")
+    parser.add_argument("--news-delay", type=float, default=0.02,
+                        help="seconds the stub newsapi delays each response by")
+    parser.add_argument("--quick", action="store_true",
+                        help="small files & few runs, to check the benchmarks themselves")
+    parser.add_argument("--output", help="file the json results are written to, printed if not given")
+    parser.add_argument("--compare", help="json results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown ratio counted as a regression by --compare")
+    args = parser.parse_args(argv)
+
+    selected = [name for name in args.only.split(",") if name]
+    for name in selected:
+        if name not in benchmarks:
+            parser.error(f"{name} is not a benchmark, valid benchmarks are: {benchmarks}")
+    rows = [int(count) for count in args.rows.split(",") if count]
+    repeat, requests = args.repeat, args.requests
+    if args.quick:
+        rows, repeat, requests = [count for count in rows if count <= 10000] or [1000], 3, 100
+
+    results = []
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        #the dashboard reads & writes files relative to the working folder
+        os.chdir(folder)
+        if "csv" in selected:
+            results += bench_covid_csv(folder, rows, repeat)
+        if "news" in selected:
+            results += bench_news(repeat, args.news_delay, [1, 3, 8])
+        if "config" in selected:
+            results += bench_config(folder, repeat, 20)
+        if "index" in selected:
+            results += bench_index(folder, requests, 200)
+        os.chdir(working_dir)
+
+    output = {"meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                       "python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "numpy": np.__version__,
+                       "arguments": vars(args)},
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as json_file:
+            json.dump(output, json_file, indent=1)
+    else:
+        print(json.dumps(output, indent=1))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as json_file:
+            return 1 if compare(results, json.load(json_file), args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""This file deals with caching responses from the Cov19API & newsapi between requests"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+class CacheEntry(NamedTuple):
+    """
+    a single cached response
+
+    Attributes:
+        value: the cached response
+        size(int): size of the response in bytes, used for the byte limit
+        expires(float): time.time() after which the entry has to be revalidated
+        validators(dict): values used to revalidate the entry with the upstream, i.e.
+                          {"ETag": ..., "Last-Modified": ...} or a Cov19API release timestamp
+    """
+    value: Any
+    size: int
+    expires: float
+    validators: Dict[str, str]
+
+class ResponseCache:
+    """
+    thread safe response cache with a time to live, evicting the least recently used
+    entries once either the entry limit or the byte limit is exceeded
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 128, max_bytes: int = 8 * 1024 * 1024):
+        """
+        Parameters:
+            ttl: number of seconds an entry is served without revalidation
+            max_entries: maximum number of entries held at once
+            max_bytes: maximum total size of the entries held at once
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        returns the value cached for key if it has not expired, counting a hit or a miss
+
+        Parameters:
+            key: request parameters identifying the response
+
+        Returns:
+            value: the cached response, or None if there is no fresh entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= time.time():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def get_stale(self, key: Hashable) -> Optional[CacheEntry]:
+        """
+        returns the entry cached for key even if it has expired, so it can be revalidated
+
+        Parameters:
+            key: request parameters identifying the response
+
+        Returns:
+            entry(CacheEntry): the cached entry, or None if there is none
+        """
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: Hashable, value: Any, size: int, validators: Optional[Dict[str, str]] = None) -> None:
+        """
+        caches a response, evicting least recently used entries if a limit is exceeded
+
+        Parameters:
+            key: request parameters identifying the response
+            value: the response to cache
+            size: size of the response in bytes
+            validators: values used to revalidate the entry once it expires
+
+        Returns:
+            None
+        """
+        #responses larger than the whole cache are never stored
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(value, size, time.time() + self.ttl, validators or {})
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def revalidate(self, key: Hashable) -> Optional[Any]:
+        """
+        marks an expired entry as fresh again, once the upstream has confirmed it is unchanged
+        (i.e. a 304 Not Modified response)
+
+        Parameters:
+            key: request parameters identifying the response
+
+        Returns:
+            value: the cached response, or None if it has been evicted meanwhile
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries[key] = entry._replace(expires=time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            self.revalidations += 1
+            return entry.value
+
+    def clear(self) -> None:
+        """
+        removes every entry, the counters are kept
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        returns the counters of the cache, used to tune its limits
+
+        Parameters:
+            None
+
+        Returns:
+            stats(dict): hits, misses, revalidations, evictions, entries and bytes
+        """
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "revalidations": self.revalidations,
+                    "evictions": self.evictions,
+                    "entries": len(self._entries),
+                    "bytes": self._bytes}
+
+    def _remove(self, key: Hashable) -> None:
+        """
+        removes an entry, the lock must already be held
+
+        Parameters:
+            key: request parameters identifying the response
+
+        Returns:
+            None
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+#cache shared by covid_data_handler & covid_news_handling
+RESPONSE_CACHE = ResponseCache()
+
+def configure_cache(settings: Dict[str, Any]) -> None:
+    """
+    applies the "Response_cache" settings from the config file to the shared cache
+
+    Parameters:
+        settings(dict): may contain "ttl_seconds", "max_entries" and "max_bytes"
+
+    Returns:
+        None
+    """
+    RESPONSE_CACHE.ttl = float(settings.get("ttl_seconds", RESPONSE_CACHE.ttl))
+    RESPONSE_CACHE.max_entries = int(settings.get("max_entries", RESPONSE_CACHE.max_entries))
+    RESPONSE_CACHE.max_bytes = int(settings.get("max_bytes", RESPONSE_CACHE.max_bytes))
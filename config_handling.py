@@ -0,0 +1,199 @@
+"""This file deals with keeping config.json in memory & writing changes back to it"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+from metrics_handling import METRICS
+
+class ConfigStore:
+    """
+    holds the contents of the config file in memory. Changes only mark the store as dirty,
+    a background thread writes them back once per interval (and once more at exit), so a
+    burst of changes costs a single write. Writes go to a temporary file which is then
+    renamed over the config file, so a crash never leaves a half written config behind
+    """
+
+    def __init__(self, filename: str = "config.json", flush_interval: float = 5.0):
+        """
+        Parameters:
+            filename: path of the config file
+            flush_interval: seconds between writes of pending changes
+        """
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self._data = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def exists(self) -> bool:
+        """
+        checks whether there is a config to use, either loaded already or on disk
+
+        Parameters:
+            None
+
+        Returns:
+            exists(bool): True if the config is loaded or the config file exists
+        """
+        return self._data is not None or os.path.exists(self.filename)
+
+    def load(self) -> Dict[str, Any]:
+        """
+        reads the config file if it has not been read yet
+
+        Parameters:
+            None
+
+        Returns:
+            config(dict): the config held in memory, change it through set() or replace()
+        """
+        with self._lock:
+            if self._data is None:
+                with METRICS.timer("config_read_seconds"), \
+                     open(self.filename, "r", encoding="utf-8") as json_file:
+                    self._data = json.load(json_file)
+            return self._data
+
+    def reload(self) -> Dict[str, Any]:
+        """
+        reads the config file again, dropping changes which have not been written yet
+
+        Parameters:
+            None
+
+        Returns:
+            config(dict): the config held in memory
+        """
+        with self._lock:
+            self._data = None
+            self._dirty = False
+            return self.load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        returns a single value of the config
+
+        Parameters:
+            key: name of the value
+            default: returned if the config has no such value
+
+        Returns:
+            value: the value held in memory
+        """
+        return self.load().get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        changes a single value of the config, the file is written later by flush()
+
+        Parameters:
+            key: name of the value
+            value: new value, must not be changed afterwards (pass a copy of shared dictionaries)
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.load()[key] = value
+            self._dirty = True
+
+    def replace(self, data: Dict[str, Any]) -> None:
+        """
+        replaces the whole config, the file is written later by flush()
+
+        Parameters:
+            data: the new config
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._data = data
+            self._dirty = True
+
+    def flush(self) -> bool:
+        """
+        writes pending changes to the config file by writing a temporary file next to it
+        and renaming it over the config file
+
+        Parameters:
+            None
+
+        Returns:
+            written(bool): True if there were changes to write
+        """
+        with self._lock:
+            if not self._dirty:
+                return False
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            file_descriptor, temp_filename = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with METRICS.timer("config_write_seconds"):
+                    with os.fdopen(file_descriptor, "w", encoding="utf-8") as json_file:
+                        json.dump(self._data, json_file)
+                        json_file.flush()
+                        os.fsync(json_file.fileno())
+                    os.replace(temp_filename, self.filename)
+            except BaseException:
+                os.remove(temp_filename)
+                raise
+            self._dirty = False
+            self.writes += 1
+            return True
+
+    def start(self, flush_interval: Optional[float] = None) -> None:
+        """
+        starts the background thread writing pending changes, they are also written at exit
+
+        Parameters:
+            flush_interval: seconds between writes, keeps the current interval if None
+
+        Returns:
+            None
+        """
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="config-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        stops the background thread & writes any pending changes
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        """
+        body of the background thread, writes pending changes once per interval
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+#config shared by every module of the dashboard
+CONFIG = ConfigStore()
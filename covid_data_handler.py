@@ -1,23 +1,63 @@
 """This file deals with requesting covid data from Cov19API"""
 
+import csv
+import io
+import os
+import re
 import sched
 import time
-from typing import List, Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Iterable, Iterator, Optional, Callable, Union
+import numpy as np
 from uk_covid19 import Cov19API
+from cache_handling import RESPONSE_CACHE
+from metrics_handling import METRICS
+from series_handling import SERIES_STORE
+from upstream_handling import FLIGHTS, UpstreamBudgetError, acquire
 
 #initializing scheduler object from sched library
 s = sched.scheduler(time.time, time.sleep)
 
-def parse_csv_data(csv_filename: str) -> List[str]:
+#valid areaType filters accepted by the Cov19API
+VALID_LOCATION_TYPES = ["overview", "nation", "region", "nhsRegion", "utla", "ltla"]
+
+#metrics requested from the Cov19API for every location
+COVID_STRUCTURE = {"date": "date",
+                   "areaName": "areaName",
+                   "newCasesBySpecimenDate": "newCasesBySpecimenDate",
+                   "hospitalCases": "hospitalCases",
+                   "cumDailyNsoDeathsByDeathDate": "cumDailyNsoDeathsByDeathDate"}
+
+#folder the series of each location is stored in for incremental refreshes
+COVID_STORE_DIR = "covid_store"
+#days before the most recent stored day that are requested again, as recent figures get revised
+DELTA_OVERLAP_DAYS = 2
+#above this many days to request, one full request is cheaper than a request per day
+MAX_DELTA_DAYS = 14
+#maximum number of locations requested at once by covid_API_batch_request
+COVID_API_MAX_WORKERS = 16
+#seconds the Cov19API release timestamp is reused for, so a refresh requesting many locations
+#or days checks it once instead of once per request
+RELEASE_TIMESTAMP_TTL = 60
+#api class -> (time.time() it was fetched at, release timestamp)
+_RELEASE_TIMESTAMPS = {}
+
+#column name in the columnar data -> metric name in the Cov19API .csv header
+COVID_COLUMNS = {"date": "date",
+                 "cases": "newCasesBySpecimenDate",
+                 "hospital": "hospitalCases",
+                 "deaths": "cumDailyNsoDeathsByDeathDate"}
+
+def iter_csv_data(csv_filename: str) -> Iterator[str]:
     """
-    converts a .csv file into a list of strings
+    lazily yields the lines of a .csv file one at a time, so only one line is held in memory
 
     Paramters:
-        csv_filename(str): the .csv file to be converted, this should be the filename or
+        csv_filename(str): the .csv file to be read, this should be the filename or
                            relative path given as a string
 
     Returns:
-        csv_data(list): a list of strings, where each string is a line of the .csv file
+        csv_data(iterator): yields strings, where each string is a line of the .csv file
     """
     #check that the given csv file is valid
     if not isinstance(csv_filename, str):
@@ -25,28 +65,55 @@ def parse_csv_data(csv_filename: str) -> List[str]:
     if csv_filename[-4:] != ".csv":
         csv_filename = csv_filename + ".csv"
 
-    #append each line of the csv to a list
-    csv_data = []
     with open(csv_filename, "r", encoding="utf-8") as csv_file:
         for line in csv_file:
-            csv_data.append(line.strip())
-        return csv_data
+            yield line.strip()
+
+def parse_csv_data(csv_filename: str) -> List[str]:
+    """
+    converts a .csv file into a list of strings
+
+    Paramters:
+        csv_filename(str): the .csv file to be converted, this should be the filename or
+                           relative path given as a string
 
+    Returns:
+        csv_data(list): a list of strings, where each string is a line of the .csv file
+    """
+    return list(iter_csv_data(csv_filename))
 
-def process_covid_csv_data(covid_csv_data: List[str]) -> Tuple[int, int, int]:
+def _drop_last(rows: Iterator[List[str]]) -> Iterator[List[str]]:
     """
-    sorts through a list of strings to find relevant data
+    yields every row apart from the last one, holding a single row back as lookahead
 
     Parameters:
-        covid_csv_data: a list of strings, where each string represents a row from a data set
+        rows: iterator of parsed .csv rows
+
+    Returns:
+        rows(iterator): the same rows without the final one
+    """
+    previous = next(rows, None)
+    for row in rows:
+        yield previous
+        previous = row
+
+def process_covid_csv_data(covid_csv_data: Iterable[str]) -> Tuple[int, int, int]:
+    """
+    sorts through strings to find relevant data, stopping as soon as all figures are found.
+    Rows are consumed lazily so the output of iter_csv_data can be passed in directly
+
+    Parameters:
+        covid_csv_data: an iterable of strings, where each string represents a row from a data set
 
     Returns:
         int(last7days_cases): the sum of cases from the last 7 days
         int(current_hospital_cases): the most recent figure for hospital cases
         int(total_deaths): the most recent figure for total deaths
     """
+    #csv.reader is used rather than str.split as area names may contain quoted commas
+    rows = csv.reader(iter(covid_csv_data))
     #check that the first string, representing the parameters of the data set contains some data
-    parameter_list = covid_csv_data[0].split(",")
+    parameter_list = next(rows, [])
     if len(parameter_list) <= 1:
         return 0, 0, 0
 
@@ -58,8 +125,8 @@ def process_covid_csv_data(covid_csv_data: List[str]) -> Tuple[int, int, int]:
     total_deaths_index = parameter_list.index("cumDailyNsoDeathsByDeathDate")
     count = 0
 
-    for i in covid_csv_data[1:-1]:
-        line = i.split(",")
+    #the last row is skipped, as it was when slicing a list with [1:-1]
+    for line in _drop_last(rows):
         #checks if total_deaths is an int -> has it been changed? and whether there is data present
         if isinstance(total_deaths, int) and line[total_deaths_index] != "":
             total_deaths = line[total_deaths_index]
@@ -81,10 +148,541 @@ def process_covid_csv_data(covid_csv_data: List[str]) -> Tuple[int, int, int]:
 
     return int(last7days_cases), int(current_hospital_cases), int(total_deaths)
 
-def covid_API_request(location: str = "Exeter", location_type:str = "ltla") -> Dict[str, int]:
+#bytes which end or quote the fields of a .csv row
+_COMMA, _NEWLINE, _QUOTE = ord(","), ord("\n"), ord('"')
+#figures are read 8 ascii bytes at a time as one 64 bit integer, so have at most 8 digits
+_MAX_DIGITS = 8
+#"0" repeated in every byte of a 64 bit integer
+_ASCII_ZEROS = np.uint64(0x3030303030303030)
+#_DIGIT_MASKS[n] keeps the last n bytes of a 64 bit integer read from a little endian .csv
+_DIGIT_MASKS = np.array([0] + [(1 << 64) - (1 << (64 - 8 * n)) for n in range(1, _MAX_DIGITS + 1)],
+                        dtype=np.uint64)
+#matches anything but whitespace, to find whether a .csv has rows after its header
+_NOT_SPACE = re.compile(r"\S")
+
+def _field_ends(data: np.ndarray, fields: int, first: int) -> Optional[np.ndarray]:
+    """
+    finds where every field of every row ends with a few passes over the whole .csv, rather
+    than splitting each row in a Python loop. Commas & newlines between quotes are not counted,
+    they are inside a quoted field such as "Bristol, City of"
+
+    Parameters:
+        data(np.ndarray): the .csv as uint8, each row ending with a newline
+        fields(int): number of fields in the header
+        first(int): index of the first byte of the first row after the header
+
+    Returns:
+        ends(np.ndarray): index of the comma or newline after each field, with one row per .csv
+                          row. None if some row does not have as many fields as the header
+    """
+    rows = data[first:]
+    delimiters = rows == _COMMA
+    found = rows == _NEWLINE
+    delimiters |= found
+    quotes = np.equal(rows, _QUOTE, out=found)
+    delimiters |= quotes
+    found = np.flatnonzero(delimiters)
+    quotes = rows[found] == _QUOTE
+    if quotes.any():
+        #a comma or newline is between quotes if an odd number of quotes comes before it
+        found = found[~(np.logical_xor.accumulate(quotes) | quotes)]
+    if found.size == 0 or found.size % fields != 0:
+        return None
+    ends = found.reshape(-1, fields)
+    if (rows[ends[:, -1]] != _NEWLINE).any():
+        return None
+    ends += first
+    return ends
+
+def _parse_dates(raw: bytes, starts: np.ndarray, ends: np.ndarray) -> Optional[np.ndarray]:
+    """
+    parses a column of YYYY-MM-DD dates, viewing the 10 bytes of each date as one bytes string
+
+    Parameters:
+        raw(bytes): the .csv
+        starts(np.ndarray): index of the first byte of each date
+        ends(np.ndarray): index of the byte after each date
+
+    Returns:
+        dates(np.ndarray): datetime64[D] array, None if a field is not a valid YYYY-MM-DD date
+    """
+    if (ends - starts != 10).any():
+        return None
+    dates = np.ndarray((len(raw) - 9,), dtype="S10", buffer=raw, strides=(1,))[starts]
+    try:
+        return dates.astype("datetime64[D]")
+    except ValueError:
+        return None
+
+def _parse_figures(raw: bytes, starts: np.ndarray, ends: np.ndarray) -> Optional[np.ndarray]:
+    """
+    parses a column of whole numbers, reading the 8 bytes which end each field as one 64 bit
+    integer & combining its digits with 3 multiplications instead of one loop per digit
+
+    Parameters:
+        raw(bytes): the .csv, with at least 8 bytes before the first figure
+        starts(np.ndarray): index of the first byte of each figure
+        ends(np.ndarray): index of the byte after each figure
+
+    Returns:
+        figures(np.ndarray): float64 array with nan for empty fields (missing data),
+                             None if a field is not a whole number of at most 8 digits
+    """
+    widths = ends - starts
+    if widths.max() > _MAX_DIGITS:
+        return None
+    words = np.ndarray((len(raw) - 7,), dtype="<u8", buffer=raw, strides=(1,))
+    #the digits become 0-9 & the bytes before the field become 0, as leading zeros. The steps
+    #below are done in place, as allocating a new array for each of them costs more than the step
+    values = words[ends - _MAX_DIGITS]
+    values ^= _ASCII_ZEROS
+    values &= _DIGIT_MASKS[widths]
+    check = values + np.uint64(0x7676767676767676)
+    check |= values
+    check &= np.uint64(0x8080808080808080)
+    if check.any():
+        return None
+    #pairs of digits, then groups of 4, then all 8 are combined
+    for scale, shift, mask in ((10, 8, 0x00FF00FF00FF00FF), (100, 16, 0x0000FFFF0000FFFF),
+                               (10000, 32, 0x00000000FFFFFFFF)):
+        values *= np.uint64(1 + (scale << shift))
+        values >>= np.uint64(shift)
+        values &= np.uint64(mask)
+    figures = values.astype(np.float64)
+    figures[widths == 0] = np.nan
+    return figures
+
+def _parse_columns_fast(header: List[str], csv_text: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    parses the rows of a Cov19API .csv straight from its bytes into typed arrays
+
+    Parameters:
+        header(list): the fields of the header row
+        csv_text(str): the .csv, each row ending with a newline
+
+    Returns:
+        columns(dict): see parse_covid_csv_columns, None if the rows are not all plain
+                       YYYY-MM-DD dates & whole numbers, np.loadtxt parses them instead
+    """
+    raw = csv_text.encode("utf-8")
+    first = raw.index(b"\n") + 1
+    #the header is read as the bytes before the first figures, so it must be long enough
+    if first < _MAX_DIGITS:
+        return None
+    ends = _field_ends(np.frombuffer(raw, dtype=np.uint8), len(header), first)
+    if ends is None:
+        return None
+    columns = {}
+    for key, name in COVID_COLUMNS.items():
+        index = header.index(name)
+        if index > 0:
+            starts = ends[:, index - 1] + 1
+        else:
+            starts = np.concatenate(([first], ends[:-1, -1] + 1))
+        parse = _parse_dates if key == "date" else _parse_figures
+        columns[key] = parse(raw, starts, ends[:, index])
+        if columns[key] is None:
+            return None
+    return columns
+
+def _fill_missing(body: str) -> str:
+    """
+    writes nan into the empty fields (missing data) of .csv rows, so np.loadtxt can parse them.
+    Only str.replace is used, which runs over the whole text in C
+
+    Parameters:
+        body(str): the rows of a .csv, each ending with a newline
+
+    Returns:
+        body(str): the same rows with nan in every empty field
+    """
+    #each replace fills every other field of a run of empty fields, so it is done twice
+    return body.replace(",,", ",nan,").replace(",,", ",nan,").replace(",\n", ",nan\n")
+
+def parse_covid_csv_columns(covid_csv_data: Union[str, Iterable[str]]) -> Dict[str, np.ndarray]:
+    """
+    parses the rows of a Cov19API .csv once into typed numpy arrays, one per column.
+    Plain dates & whole numbers are parsed from the bytes of the whole .csv at once, anything
+    else (decimals, quoted figures, ...) is parsed by np.loadtxt
+
+    Parameters:
+        covid_csv_data: the .csv as a single string, or an iterable of strings where each
+                        string represents a row from a data set, the first row must be the header
+
+    Returns:
+        columns(dict): dict with the keys of COVID_COLUMNS, "date" holds datetime64[D] values,
+                       the others hold float64 values with nan for missing data. Rows keep the
+                       order of the .csv (most recent day first for Cov19API data)
+    """
+    if isinstance(covid_csv_data, str):
+        csv_text = covid_csv_data
+    else:
+        csv_text = "\n".join(covid_csv_data)
+    if "\r" in csv_text:
+        csv_text = csv_text.replace("\r", "")
+    if not csv_text.endswith("\n"):
+        csv_text += "\n"
+    first = csv_text.index("\n") + 1
+    #csv.reader is used rather than str.split as area names may contain quoted commas
+    header = next(csv.reader([csv_text[:first].strip()]), [])
+    if len(header) <= 1 or not _NOT_SPACE.search(csv_text, first):
+        return _empty_columns()
+    columns = _parse_columns_fast(header, csv_text)
+    if columns is not None:
+        return columns
+
+    table = np.loadtxt(io.StringIO(_fill_missing(csv_text[first:])), delimiter=",",
+                       quotechar='"', ndmin=1,
+                       usecols=[header.index(name) for name in COVID_COLUMNS.values()],
+                       dtype=[(key, "datetime64[D]" if key == "date" else np.float64)
+                              for key in COVID_COLUMNS])
+    return {key: np.ascontiguousarray(table[key]) for key in COVID_COLUMNS}
+
+def _latest_value(values: np.ndarray) -> int:
+    """
+    returns the first value with data in a column, or 0 if the whole column is empty
+
+    Parameters:
+        values(np.ndarray): float column with nan for missing data, most recent day first
+
+    Returns:
+        value(int): the most recent figure in the column
+    """
+    present = np.flatnonzero(~np.isnan(values))
+    if present.size == 0:
+        return 0
+    return int(values[present[0]])
+
+def case_window_sum(columns: Dict[str, np.ndarray], days: int = 7) -> int:
+    """
+    sums the cases over a number of days, ignoring the most recent day with data as it is
+    incomplete. This is the vectorized equivalent of the loop in process_covid_csv_data
+
+    Parameters:
+        columns: the columnar data returned by parse_covid_csv_columns
+        days: the number of days to sum over, i.e. 7, 14 or 28
+
+    Returns:
+        cases(int): the sum of cases over the given number of days
+    """
+    cases = columns["cases"]
+    present = np.flatnonzero(~np.isnan(cases))
+    if present.size == 0:
+        return 0
+    start = present[0] + 1
+    return int(np.nansum(cases[start:start + days]))
+
+def rolling_case_sums(columns: Dict[str, np.ndarray], window: int = 7) -> np.ndarray:
+    """
+    computes the sum of cases over every window of consecutive days in one pass
+
+    Parameters:
+        columns: the columnar data returned by parse_covid_csv_columns
+        window: the number of days in each window
+
+    Returns:
+        sums(np.ndarray): sums[i] is the sum of cases for the rows i to i + window - 1,
+                          missing days count as 0. Empty if there are fewer rows than window
+    """
+    cases = np.nan_to_num(columns["cases"])
+    if window <= 0 or cases.size < window:
+        return np.array([], dtype=np.float64)
+    totals = np.concatenate(([0.0], np.cumsum(cases)))
+    return totals[window:] - totals[:-window]
+
+def process_covid_columns(columns: Dict[str, np.ndarray]) -> Tuple[int, int, int]:
+    """
+    computes the dashboard figures from columnar data with vectorized operations
+
+    Parameters:
+        columns: the columnar data returned by parse_covid_csv_columns
+
+    Returns:
+        int(last7days_cases): the sum of cases from the last 7 days
+        int(current_hospital_cases): the most recent figure for hospital cases
+        int(total_deaths): the most recent figure for total deaths
+    """
+    return (case_window_sum(columns, 7),
+            _latest_value(columns["hospital"]),
+            _latest_value(columns["deaths"]))
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    """
+    returns columnar data without any rows
+
+    Parameters:
+        None
+
+    Returns:
+        columns(dict): the keys of COVID_COLUMNS mapped to empty arrays
+    """
+    return {"date": np.array([], dtype="datetime64[D]"),
+            "cases": np.array([], dtype=np.float64),
+            "hospital": np.array([], dtype=np.float64),
+            "deaths": np.array([], dtype=np.float64)}
+
+def merge_covid_columns(old: Dict[str, np.ndarray], new: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    merges two sets of columnar data, rows from new replace rows from old with the same date
+
+    Parameters:
+        old: columnar data, i.e. loaded from the local store
+        new: columnar data, i.e. the days requested in a delta refresh
+
+    Returns:
+        columns(dict): the union of both, ordered with the most recent day first
+    """
+    combined = {key: np.concatenate((new[key], old[key])) for key in COVID_COLUMNS}
+    #np.unique keeps the first occurrence of each date, which comes from new
+    _, first = np.unique(combined["date"], return_index=True)
+    order = first[::-1]
+    return {key: values[order] for key, values in combined.items()}
+
+def _store_path(location: str, location_type: str, store_dir: str) -> str:
+    """
+    returns the path of the file a location's series is stored in
+
+    Parameters:
+        location: The name of the area
+        location_type: The type of location
+        store_dir: folder holding the stored series
+
+    Returns:
+        path(str): path to the .npz file for this location
+    """
+    name = re.sub(r"[^A-Za-z0-9]+", "_", f"{location_type}_{location}".lower())
+    return os.path.join(store_dir, f"{name}.npz")
+
+def load_covid_columns(location: str, location_type: str,
+                       store_dir: str = COVID_STORE_DIR) -> Optional[Dict[str, np.ndarray]]:
+    """
+    loads the series previously stored for a location
+
+    Parameters:
+        location: The name of the area
+        location_type: The type of location
+        store_dir: folder holding the stored series
+
+    Returns:
+        columns(dict): the stored columnar data, or None if nothing is stored
+    """
+    path = _store_path(location, location_type, store_dir)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as stored:
+        return {key: stored[key] for key in COVID_COLUMNS}
+
+def save_covid_columns(columns: Dict[str, np.ndarray], location: str, location_type: str,
+                       store_dir: str = COVID_STORE_DIR) -> None:
+    """
+    stores the series of a location, written to a temporary file first so a crash mid-write
+    never leaves a corrupt store behind
+
+    Parameters:
+        columns: the columnar data to store
+        location: The name of the area
+        location_type: The type of location
+        store_dir: folder holding the stored series
+
+    Returns:
+        None
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    path = _store_path(location, location_type, store_dir)
+    with open(path + ".tmp", "wb") as store_file:
+        np.savez(store_file, **columns)
+    os.replace(path + ".tmp", path)
+
+def _delta_dates(stored: Optional[Dict[str, np.ndarray]]) -> Optional[List[str]]:
+    """
+    works out which days need requesting to bring a stored series up to date
+
+    Parameters:
+        stored: the stored columnar data, or None
+
+    Returns:
+        dates(list): days to request as YYYY-MM-DD strings, most recent first.
+                     None if the full history should be requested instead
+    """
+    if stored is None or stored["date"].size == 0:
+        return None
+    today = np.datetime64(time.strftime("%Y-%m-%d", time.gmtime()), "D")
+    start = stored["date"].max() - np.timedelta64(DELTA_OVERLAP_DAYS, "D")
+    days = int((today - start) / np.timedelta64(1, "D")) + 1
+    if days > MAX_DELTA_DAYS:
+        return None
+    return [str(today - np.timedelta64(day, "D")) for day in range(max(days, 1))]
+
+def _request_covid_csv(filters: List[str], save_as: Optional[str] = None,
+                       api_class: Callable = Cov19API) -> str:
+    """
+    Requests a .csv from the Cov19API, going through the shared response cache. Expired entries
+    are revalidated against the Cov19API release timestamp and only requested again once new
+    data has been released. Concurrent requests with the same filters share a single request
+
+    Parameters:
+        filters: the Cov19API filters of the request
+        save_as: debug option, filename the raw .csv is also dumped to, bypasses the cache
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+
+    Returns:
+        csv_data(str): the requested .csv
+    """
+    key = ("covid",) + tuple(filters)
+    if save_as is not None:
+        return _fetch_covid_csv(key, filters, save_as, api_class)
+    csv_data = RESPONSE_CACHE.get(key)
+    if csv_data is not None:
+        METRICS.inc("covid_requests_total", labels={"result": "hit"})
+        return csv_data
+    return FLIGHTS.do(key, _fetch_covid_csv, key, filters, None, api_class)
+
+def _fetch_release_timestamp(api_class: Callable) -> str:
+    """
+    requests the Cov19API release timestamp, using up one request of the "covid" budget,
+    and remembers it for RELEASE_TIMESTAMP_TTL seconds
+
+    Parameters:
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+
+    Returns:
+        release(str): the release timestamp
+
+    Raises:
+        UpstreamBudgetError: if the budget is used up
+    """
+    acquire("covid")
+    release = api_class.get_release_timestamp()
+    _RELEASE_TIMESTAMPS[api_class] = (time.time(), release)
+    return release
+
+def _release_timestamp(api_class: Callable, fetch: bool) -> Optional[str]:
+    """
+    returns the Cov19API release timestamp, requested at most once every RELEASE_TIMESTAMP_TTL
+    seconds. Concurrent requests for it share a single request
+
+    Parameters:
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+        fetch: request the timestamp if it is not remembered, otherwise only a remembered one is returned
+
+    Returns:
+        release(str): the release timestamp, None if it is not known or the api class has none
+
+    Raises:
+        UpstreamBudgetError: if the budget is used up
+    """
+    cached = _RELEASE_TIMESTAMPS.get(api_class)
+    if cached is not None and time.time() - cached[0] < RELEASE_TIMESTAMP_TTL:
+        return cached[1]
+    #fake clients may not provide a release timestamp, their entries then simply expire
+    if not fetch or not hasattr(api_class, "get_release_timestamp"):
+        return None
+    return FLIGHTS.do(("covid", "release", api_class), _fetch_release_timestamp, api_class)
+
+def _fetch_covid_csv(key: Tuple[str, ...], filters: List[str], save_as: Optional[str],
+                     api_class: Callable) -> str:
+    """
+    makes the request of _request_covid_csv once the cache could not answer it. Every call to
+    the Cov19API uses up one request of the "covid" budget, once it is used up an expired
+    entry is served instead
+
+    Parameters:
+        key: key of the response in the shared response cache
+        filters: the Cov19API filters of the request
+        save_as: debug option, filename the raw .csv is also dumped to, bypasses the cache
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+
+    Returns:
+        csv_data(str): the requested .csv
+
+    Raises:
+        UpstreamBudgetError: if the budget is used up & nothing is cached
+    """
+    entry = RESPONSE_CACHE.get_stale(key)
+    #a request which finished just before this one started may have filled the cache
+    if save_as is None and entry is not None and entry.expires > time.time():
+        return entry.value
+
+    try:
+        #only an expired entry is revalidated, without one a remembered timestamp is only stored
+        release = _release_timestamp(api_class, save_as is None and entry is not None)
+        if save_as is None and release and entry and entry.validators.get("release") == release:
+            csv_data = RESPONSE_CACHE.revalidate(key)
+            if csv_data is not None:
+                METRICS.inc("covid_requests_total", labels={"result": "revalidated"})
+                return csv_data
+        acquire("covid")
+    except UpstreamBudgetError:
+        if save_as is None and entry is not None:
+            METRICS.inc("covid_requests_total", labels={"result": "stale"})
+            return entry.value
+        raise
+
+    api = api_class(filters=filters, structure=COVID_STRUCTURE)
+    csv_data = api.get_csv(save_as=save_as)
+    METRICS.inc("covid_requests_total", labels={"result": "fetched"})
+    RESPONSE_CACHE.put(key, csv_data, len(csv_data), {"release": release} if release else None)
+    return csv_data
+
+def request_covid_columns(location: str, location_type: str, dates: Optional[List[str]] = None,
+                          save_as: Optional[str] = None,
+                          api_class: Callable = Cov19API) -> Dict[str, np.ndarray]:
+    """
+    Requests covid data pertaining to a location from the Cov19API and parses it into columns
+
+    Parameters:
+        location: The name of the area in which you are interested
+        location_type: The type of location your location is, one of VALID_LOCATION_TYPES
+        dates: only request these days (YYYY-MM-DD), one request is made per day.
+               None requests the full history in a single request
+        save_as: debug option, filename the raw .csv is also dumped to (full history only)
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+
+    Returns:
+        columns(dict): the columnar data, see parse_covid_csv_columns
+    """
+    #URL sent for the .csv request
+    location_filter = [f"areaType={location_type}", f"areaName={location}"]
+
+    #using the Cov19API tool to request data, the csv is returned as a string in memory
+    if dates is None:
+        with METRICS.timer("covid_request_seconds"):
+            csv_data = _request_covid_csv(location_filter, save_as, api_class)
+        with METRICS.timer("covid_parse_seconds"):
+            return parse_covid_csv_columns(csv_data)
+
+    columns = _empty_columns()
+    for date in dates:
+        with METRICS.timer("covid_request_seconds"):
+            csv_data = _request_covid_csv(location_filter + [f"date={date}"], api_class=api_class)
+        with METRICS.timer("covid_parse_seconds"):
+            columns = merge_covid_columns(columns, parse_covid_csv_columns(csv_data))
+    return columns
+
+def _covid_metrics(columns: Dict[str, np.ndarray]) -> Dict[str, int]:
+    """
+    formats the dashboard figures computed from columnar data into a dictionary
+
+    Parameters:
+        columns: the columnar data returned by parse_covid_csv_columns
+
+    Returns:
+        final_data(dictionary): last7days_cases, hospital_cases & deaths
+    """
+    with METRICS.timer("covid_compute_seconds"):
+        last7days_cases, hospital_cases, deaths = process_covid_columns(columns)
+    final_data = {"last7days_cases" : last7days_cases,
+                  "hospital_cases" : hospital_cases,
+                  "deaths" : deaths}
+    return final_data
+
+def covid_API_request(location: str = "Exeter", location_type:str = "ltla",
+                      save_as: Optional[str] = None, api_class: Callable = Cov19API) -> Dict[str, int]:
     """
     Requests a .csv with covid data pertaining to a specified location, then process this .csv file
-    using parse_csv_data and process_covid_csv_data to return a dictionary with relevant data
+    using parse_covid_csv_columns and process_covid_columns to return a dictionary with relevant data.
+    The response is kept in memory and handed straight to the processor, nothing touches the disk
+    unless save_as is given
 
     Parameters:
         location: The name of the area in which you are interested as a string. First letter must be
@@ -92,38 +690,134 @@ def covid_API_request(location: str = "Exeter", location_type:str = "ltla") -> D
         location_type: The type of location your location is as a string. More info can be found on
                        the Cov19API website:
                        https://coronavirus.data.gov.uk/details/developers-guide/main-api
+        save_as: debug option, filename the raw .csv is also dumped to (i.e. "data.csv")
+        api_class: class used to request the data, Cov19API unless a fake client is injected
 
     Returns:
         final_data(dictionary): returns dict with relevant data extracted from the requested CSV
     """
-    valid_location_types = ["overview", "nation", "region", "nhsRegion", "utla", "ltla"]
     #check validity of given parameters
     if not isinstance(location_type, str):
         location_type = str(location_type)
     if not isinstance(location, str):
         location = str(location)
-    if location_type not in valid_location_types:
-        return print(f"{location_type} is invalid, valid location types are: {str(valid_location_types)}")
+    if location_type not in VALID_LOCATION_TYPES:
+        return print(f"{location_type} is invalid, valid location types are: {str(VALID_LOCATION_TYPES)}")
 
-    #URL sent for the .csv request
-    location_filter = [f"areaType={location_type}", f"areaName={location}"]
+    #parse the csv once into columns, keep them for /api/series & compute the final data from them
+    columns = request_covid_columns(location, location_type, save_as=save_as, api_class=api_class)
+    SERIES_STORE.put((location_type, location), columns)
+    return _covid_metrics(columns)
 
-    #using the Cov19API tool to request data
-    data = {"date": "date",
-            "areaName": "areaName",
-            "newCasesBySpecimenDate": "newCasesBySpecimenDate",
-            "hospitalCases": "hospitalCases",
-            "cumDailyNsoDeathsByDeathDate": "cumDailyNsoDeathsByDeathDate"}
-    api = Cov19API(filters=location_filter, structure=data)
-    data_filename = "data.csv"
-    api.get_csv(save_as=data_filename)
-
-    #process & format csv to get final data
-    last7days_cases, hospital_cases, deaths = process_covid_csv_data(parse_csv_data(data_filename))
-    final_data = {"last7days_cases" : last7days_cases,
-                  "hospital_cases" : hospital_cases,
-                  "deaths" : deaths}
-    return final_data
+def covid_API_delta_request(location: str = "Exeter", location_type: str = "ltla",
+                            store_dir: str = COVID_STORE_DIR,
+                            api_class: Callable = Cov19API) -> Dict[str, int]:
+    """
+    Same as covid_API_request, but only requests the days after the most recent day stored
+    locally for this location (plus a few days of overlap, as recent figures get revised).
+    The new days are merged into the store and the figures are recomputed from it.
+    The full history is only requested when nothing is stored or the store is too old.
+    Concurrent refreshes of the same location share a single refresh
+
+    Parameters:
+        location: The name of the area in which you are interested
+        location_type: The type of location your location is, one of VALID_LOCATION_TYPES
+        store_dir: folder holding the stored series, one .npz file per location
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+
+    Returns:
+        final_data(dictionary): returns dict with relevant data extracted from the merged series
+    """
+    #check validity of given parameters
+    if not isinstance(location_type, str):
+        location_type = str(location_type)
+    if not isinstance(location, str):
+        location = str(location)
+    if location_type not in VALID_LOCATION_TYPES:
+        return print(f"{location_type} is invalid, valid location types are: {str(VALID_LOCATION_TYPES)}")
+
+    return FLIGHTS.do(("covid", "delta", location_type, location, store_dir),
+                      _covid_delta_refresh, location, location_type, store_dir, api_class)
+
+def _covid_delta_refresh(location: str, location_type: str, store_dir: str,
+                         api_class: Callable) -> Dict[str, int]:
+    """
+    brings the stored series of a location up to date, the body of covid_API_delta_request
+
+    Parameters:
+        location: The name of the area
+        location_type: The type of location, one of VALID_LOCATION_TYPES
+        store_dir: folder holding the stored series, one .npz file per location
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+
+    Returns:
+        final_data(dictionary): returns dict with relevant data extracted from the merged series
+    """
+    stored = load_covid_columns(location, location_type, store_dir)
+    dates = _delta_dates(stored)
+    if dates is None:
+        columns = request_covid_columns(location, location_type, api_class=api_class)
+    else:
+        columns = merge_covid_columns(stored, request_covid_columns(location, location_type, dates,
+                                                                    api_class=api_class))
+    save_covid_columns(columns, location, location_type, store_dir)
+    SERIES_STORE.put((location_type, location), columns)
+    return _covid_metrics(columns)
+
+def covid_stored_data(location: str = "Exeter", location_type: str = "ltla",
+                      store_dir: str = COVID_STORE_DIR) -> Optional[Dict[str, int]]:
+    """
+    computes the figures from the series stored by the last covid_API_delta_request for a
+    location, without any request to the Cov19API. Used to show data straight away at startup,
+    the series is also loaded into SERIES_STORE
+
+    Parameters:
+        location: The name of the area in which you are interested
+        location_type: The type of location your location is, one of VALID_LOCATION_TYPES
+        store_dir: folder holding the stored series, one .npz file per location
+
+    Returns:
+        final_data(dictionary): dict with the figures, None if nothing is stored for the location
+    """
+    stored = load_covid_columns(location, location_type, store_dir)
+    if stored is None:
+        return None
+    SERIES_STORE.put((location_type, location), stored)
+    return _covid_metrics(stored)
+
+def covid_API_batch_request(areas: Iterable[Tuple[str, str]], max_workers: Optional[int] = None,
+                            api_class: Callable = Cov19API,
+                            incremental: bool = False) -> Dict[Tuple[str, str], Dict[str, int]]:
+    """
+    Requests covid data for several locations at once, each request runs in its own thread and
+    keeps its response in its own in-memory buffer, so the total time is that of the slowest area
+
+    Parameters:
+        areas: (location_type, location) pairs, i.e. [("ltla", "Exeter"), ("nation", "England")]
+        max_workers: maximum number of requests in flight at once,
+                     defaults to one per area up to COVID_API_MAX_WORKERS
+        api_class: class used to request the data, Cov19API unless a fake client is injected
+        incremental: use covid_API_delta_request, only requesting days missing from the local store
+
+    Returns:
+        results(dict): (location_type, location) -> dict returned by covid_API_request,
+                       None for a location whose request failed, so one area can't fail the batch
+    """
+    areas = list(dict.fromkeys(areas))
+    if not areas:
+        return {}
+    request_func = covid_API_delta_request if incremental else covid_API_request
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(areas), COVID_API_MAX_WORKERS)) as executor:
+        futures = {area: executor.submit(request_func, area[1], area[0], api_class=api_class)
+                   for area in areas}
+        results = {}
+        for area, future in futures.items():
+            try:
+                results[area] = future.result()
+            except Exception as error:
+                print(f"Error: covid data request for {area[1]} ({area[0]}) failed: {error!r}")
+                results[area] = None
+        return results
 
 def schedule_covid_updates(update_name:None, update_interval:int, arguments:Tuple[str]) -> None:
     """
@@ -1,8 +1,142 @@
 """This file deals with requesting article from https://newsapi.org/"""
 
-import json
-from typing import Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache_handling import RESPONSE_CACHE
+from config_handling import CONFIG
+from metrics_handling import METRICS
+from upstream_handling import FLIGHTS, UpstreamBudgetError, acquire
+
+#endpoint articles are requested from
+NEWS_API_URL = "https://newsapi.org/v2/top-headlines"
+#(connect, read) timeout in seconds of a single request to the newsapi
+NEWS_API_TIMEOUT = (3.05, 10)
+#maximum number of search terms requested at once
+NEWS_API_MAX_WORKERS = 8
+#title of the article standing in for the articles of a term whose request failed
+NEWS_ERROR_TITLE = "News API request failed"
+
+def _make_session() -> requests.Session:
+    """
+    creates the session shared by every request to the newsapi, connections are kept alive
+    & reused between requests, failed requests are retried with exponential backoff
+
+    parameters:
+        None
+
+    returns:
+        session(requests.Session): the pooled session
+    """
+    #read timeouts are not retried, a slow newsapi would otherwise stall the update several times over
+    retry = Retry(total=2, read=0, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=NEWS_API_MAX_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+SESSION = _make_session()
+
+def _request_term_articles(term: str, country: str, language: str, API_key: str) -> Dict[str, str]:
+    """
+    requests the articles for a single search term, going through the shared response cache.
+    Concurrent requests for the same term share a single request
+
+    parameters:
+        term(str): keyword to search for articles containing it
+        country(str): get news articles from a certain country
+        language(str): get news articles in a certain language
+        API_key(str): API key needed to request articles from the newsapi
+
+    returns:
+        news(dict):dictionary containing articles in title:content format
+    """
+    key = ("news", term, country, language)
+    news = RESPONSE_CACHE.get(key)
+    if news is not None:
+        return news
+    return FLIGHTS.do(key, _fetch_term_articles, key, term, country, language, API_key)
+
+def _fetch_term_articles(key: Tuple[str, ...], term: str, country: str, language: str,
+                         API_key: str) -> Dict[str, str]:
+    """
+    makes the request of _request_term_articles once the cache could not answer it. Expired
+    entries are revalidated with the ETag/Last-Modified headers given by the newsapi. Every
+    request uses up one request of the "news" budget, once it is used up the expired
+    articles are served instead
+
+    parameters:
+        key(tuple): key of the response in the shared response cache
+        term(str): keyword to search for articles containing it
+        country(str): get news articles from a certain country
+        language(str): get news articles in a certain language
+        API_key(str): API key needed to request articles from the newsapi
+
+    returns:
+        news(dict):dictionary containing articles in title:content format
+    """
+    entry = RESPONSE_CACHE.get_stale(key)
+    #a request which finished just before this one started may have filled the cache
+    if entry is not None and entry.expires > time.time():
+        return entry.value
+    try:
+        acquire("news")
+    except UpstreamBudgetError:
+        if entry is not None:
+            return entry.value
+        return {NEWS_ERROR_TITLE: "the newsapi request budget is used up, try again later"}
+
+    url_args = {"country": country, "language": language, "q": term, "apiKey": API_key}
+
+    #send the validators of an expired entry so the newsapi can answer 304 Not Modified
+    headers = {}
+    if entry is not None:
+        if "ETag" in entry.validators:
+            headers["If-None-Match"] = entry.validators["ETag"]
+        if "Last-Modified" in entry.validators:
+            headers["If-Modified-Since"] = entry.validators["Last-Modified"]
+
+    #use the shared session to access articles, a slow or failing newsapi only costs
+    #this term its articles instead of stalling the whole update
+    news = {}
+    try:
+        with METRICS.timer("news_term_seconds", {"term": term}):
+            response = SESSION.get(NEWS_API_URL, params=url_args, headers=headers, timeout=NEWS_API_TIMEOUT)
+            if response.status_code == 304:
+                news = RESPONSE_CACHE.revalidate(key)
+                if news is not None:
+                    return news
+                news = {}
+                acquire("news")
+                response = SESSION.get(NEWS_API_URL, params=url_args, timeout=NEWS_API_TIMEOUT)
+            requested_articles = response.json()
+    except (requests.RequestException, ValueError, UpstreamBudgetError) as error:
+        METRICS.inc("news_errors_total", labels={"term": term})
+        #only the type of error is shown, the message would contain the url & API key
+        news[NEWS_ERROR_TITLE] = f"could not reach the newsapi ({type(error).__name__})"
+        return news
+
+    #the requested json file has a specific structure, to see what parameters
+    #are given, check https://newsapi.org/
+    if requested_articles["status"] == "error":
+        #errors are not cached so the next request tries again
+        METRICS.inc("news_errors_total", labels={"term": term})
+        news[NEWS_ERROR_TITLE] = requested_articles["message"]
+        return news
+
+    articles = requested_articles["articles"]
+    METRICS.inc("news_articles_total", len(articles), {"term": term})
+    for article in articles:
+        news[article["title"]] = article["content"]
+    validators = {name: response.headers[name] for name in ("ETag", "Last-Modified")
+                  if name in response.headers}
+    RESPONSE_CACHE.put(key, news, len(response.content), validators)
+    return news
 
 def news_API_request(covid_terms:str = "Covid COVID-19 coronavirus") -> Dict[str, str]:
     """
@@ -24,37 +158,24 @@ def news_API_request(covid_terms:str = "Covid COVID-19 coronavirus") -> Dict[str
     if not isinstance(covid_terms, str):
         covid_terms = str(covid_terms)
 
-    #retrieve hidden parameters from config file
-    with open("config.json", "r", encoding="utf-8") as json_file:
-        config = json.load(json_file)
-        news_API_request_terms = config["news_API_request_terms"]
-        API_key = news_API_request_terms["covidnews_API_key"]
-        url_args = news_API_request_terms["url_args"]
-        country = url_args["country"]
-        language = url_args["language"]
-        covid_terms = url_args["Covid_terms"]
+    #retrieve hidden parameters from config file, held in memory by CONFIG
+    news_API_request_terms = CONFIG.get("news_API_request_terms")
+    API_key = news_API_request_terms["covidnews_API_key"]
+    url_args = news_API_request_terms["url_args"]
+    country = url_args["country"]
+    language = url_args["language"]
+    covid_terms = url_args["Covid_terms"]
 
     #split in case given covid_terms has multiple keywords in it
-    covid_term = covid_terms.split()
-    for term in covid_term:
-        url = ('https://newsapi.org/v2/top-headlines?'
-               'country=' + country + '&'
-               'language=' + language + '&'
-               'q=' + term + '&'
-               'apiKey=' + API_key)
-
-        #use request library from newsapi to access articles
-        response = requests.get(url)
-        requested_articles = response.json()
-        #the requested json file has a specific structure, to see what parameters
-        #are given, check https://newsapi.org/
-        if requested_articles["status"] == "error":
-            news["News API request failed"] = requested_articles["message"]
-
-        else:
-            articles = requested_articles["articles"]
-            for article in articles:
-                news[article["title"]] = article["content"]
+    #every term is requested at once, results are merged in the order of the terms
+    covid_term = list(dict.fromkeys(covid_terms.split()))
+    if not covid_term:
+        return news
+    with ThreadPoolExecutor(max_workers=min(len(covid_term), NEWS_API_MAX_WORKERS)) as executor:
+        results = executor.map(lambda term: _request_term_articles(term, country, language, API_key),
+                               covid_term)
+        for term_news in results:
+            news.update(term_news)
 
     return news
 
@@ -0,0 +1,129 @@
+"""This file deals with pushing changes of the dashboard to browsers as Server-Sent Events"""
+
+import json
+import queue
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+def format_event(event_id: str, event: str, data: Dict[str, Any]) -> bytes:
+    """
+    formats an event in the text/event-stream format
+
+    Parameters:
+        event_id(str): id of the event, sent back by the browser as Last-Event-ID on reconnect
+        event(str): name of the event, i.e. "diff"
+        data(dict): json serialisable data of the event
+
+    Returns:
+        payload(bytes): the encoded event, ending with a blank line
+    """
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+class Subscriber:
+    """
+    a browser connected to the event stream
+
+    Attributes:
+        events(queue.Queue): (number, payload) of each event not yet sent to the browser
+        overflowed(bool): set when the browser fell behind & events were dropped, it then has
+                          to be sent the full state instead
+    """
+    __slots__ = ("events", "overflowed")
+
+    def __init__(self, max_events: int):
+        self.events = queue.Queue(max_events)
+        self.overflowed = False
+
+class EventHub:
+    """
+    thread safe hub fanning events out to every connected browser. Each event is encoded once,
+    and the most recent events are kept so a browser which reconnects can be sent the events
+    it missed instead of the full state. A browser which does not keep up is not waited for,
+    its queue is dropped & it is sent the full state
+    """
+
+    def __init__(self, history: int = 256, max_events: int = 64):
+        """
+        Parameters:
+            history: number of recent events kept for reconnecting browsers
+            max_events: number of events queued per browser before it counts as fallen behind
+        """
+        self.max_events = max_events
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, number: int, payload: bytes) -> None:
+        """
+        sends an event to every connected browser
+
+        Parameters:
+            number(int): increasing number of the event, i.e. the version of the state it leads to
+            payload(bytes): the event, encoded by format_event()
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._history.append((number, payload))
+            for subscriber in self._subscribers:
+                if subscriber.overflowed:
+                    continue
+                try:
+                    subscriber.events.put_nowait((number, payload))
+                except queue.Full:
+                    subscriber.overflowed = True
+
+    def subscribe(self) -> Subscriber:
+        """
+        connects a browser, events published from now on are queued for it
+
+        Parameters:
+            None
+
+        Returns:
+            subscriber(Subscriber): the browser's queue, pass it to unsubscribe() once it disconnects
+        """
+        subscriber = Subscriber(self.max_events)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        disconnects a browser
+
+        Parameters:
+            subscriber(Subscriber): returned by subscribe()
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def since(self, number: int) -> Optional[List[Tuple[int, bytes]]]:
+        """
+        returns the events published after a given event, for a browser which reconnects
+
+        Parameters:
+            number(int): number of the last event the browser received
+
+        Returns:
+            events(list): (number, payload) of every later event, None if some of them are no
+                          longer kept, the browser then needs the full state
+        """
+        with self._lock:
+            events = [event for event in self._history if event[0] > number]
+            oldest = self._history[0][0] if self._history else None
+        #the event directly after number must still be kept, otherwise some were dropped
+        if events and events[0][0] != number + 1:
+            return None
+        if not events and oldest is not None and oldest > number + 1:
+            return None
+        return events
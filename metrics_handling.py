@@ -0,0 +1,259 @@
+"""This file deals with counting & timing the work done by the dashboard, exposed at /metrics"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+#upper bounds in seconds of the histogram buckets used for every timing
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+def _label_key(labels: Optional[Dict[str, str]]) -> Tuple[Tuple[str, str], ...]:
+    """
+    converts labels into a hashable key, so the same labels in any order are the same series
+
+    Parameters:
+        labels(dict): label name -> value, or None
+
+    Returns:
+        key(tuple): sorted (name, value) pairs
+    """
+    if not labels:
+        return ()
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    """
+    formats labels as in the Prometheus text format, i.e. {area="Exeter",le="0.5"}
+
+    Parameters:
+        key(tuple): (name, value) pairs returned by _label_key
+        extra(str): an already formatted label added at the end, i.e. le="0.5"
+
+    Returns:
+        labels(str): the formatted labels, an empty string if there are none
+    """
+    pairs = ['{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for name, value in key]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class MetricsRegistry:
+    """
+    thread safe registry of counters, gauges & histograms, rendered in the Prometheus text
+    format. Recording a value costs a dictionary update under a lock, so it can stay enabled
+    on the hot paths
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Parameters:
+            buckets: upper bounds in seconds of the histogram buckets
+        """
+        self.buckets = buckets
+        #name -> (type, help text)
+        self._descriptions = {}
+        #name -> label key -> value
+        self._counters = {}
+        self._gauges = {}
+        #name -> label key -> [count per bucket..., count, sum]
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, help_text: str) -> None:
+        """
+        sets the type & help text shown for a metric
+
+        Parameters:
+            name(str): name of the metric
+            metric_type(str): "counter", "gauge" or "histogram"
+            help_text(str): one line description of the metric
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        adds to a counter
+
+        Parameters:
+            name(str): name of the counter
+            value(float): amount added
+            labels(dict): labels of the series, i.e. {"term": "Covid"}
+
+        Returns:
+            None
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        sets a gauge
+
+        Parameters:
+            name(str): name of the gauge
+            value(float): the current value
+            labels(dict): labels of the series
+
+        Returns:
+            None
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        records a value, i.e. a duration in seconds, in a histogram
+
+        Parameters:
+            name(str): name of the histogram
+            value(float): the recorded value
+            labels(dict): labels of the series
+
+        Returns:
+            None
+        """
+        key = _label_key(labels)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.buckets) + 2)
+            if bucket < len(self.buckets):
+                counts[bucket] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[Dict[str, str]] = None) -> Iterator[None]:
+        """
+        records the time spent in a with block in a histogram, also when the block raises
+
+        Parameters:
+            name(str): name of the histogram
+            labels(dict): labels of the series
+
+        Returns:
+            context(contextmanager): use as "with METRICS.timer(name):"
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def value(self, name: str, labels: Optional[Dict[str, str]] = None) -> Optional[float]:
+        """
+        returns the value of a counter or gauge, or the number of values in a histogram
+
+        Parameters:
+            name(str): name of the metric
+            labels(dict): labels of the series
+
+        Returns:
+            value(float): the current value, None if nothing has been recorded
+        """
+        key = _label_key(labels)
+        with self._lock:
+            for metrics in (self._counters, self._gauges):
+                if key in metrics.get(name, {}):
+                    return metrics[name][key]
+            counts = self._histograms.get(name, {}).get(key)
+            return None if counts is None else counts[-2]
+
+    def render(self) -> str:
+        """
+        formats every metric in the Prometheus text exposition format (version 0.0.4)
+
+        Parameters:
+            None
+
+        Returns:
+            text(str): the metrics, one line per series
+        """
+        lines = []
+        with self._lock:
+            for metric_type, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted(metrics):
+                    self._header(lines, name, metric_type)
+                    for key, value in metrics[name].items():
+                        lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                self._header(lines, name, "histogram")
+                for key, counts in self._histograms[name].items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(key, 'le="{:g}"'.format(bound))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    bucket_labels = _format_labels(key, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{bucket_labels} {counts[-2]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {counts[-1]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {counts[-2]}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """
+        removes every recorded value, the descriptions are kept
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def _header(self, lines: List[str], name: str, metric_type: str) -> None:
+        """
+        adds the # HELP & # TYPE lines of a metric, the lock must already be held
+
+        Parameters:
+            lines(list): lines of the rendered metrics
+            name(str): name of the metric
+            metric_type(str): type used if the metric has not been described
+
+        Returns:
+            None
+        """
+        metric_type, help_text = self._descriptions.get(name, (metric_type, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+#metrics shared by every module of the dashboard
+METRICS = MetricsRegistry()
+
+for _name, _type, _help in (
+        ("covid_request_seconds", "histogram", "time spent requesting a covid .csv, cached responses included"),
+        ("covid_parse_seconds", "histogram", "time spent parsing a covid .csv into columns"),
+        ("covid_compute_seconds", "histogram", "time spent computing the covid figures of an area"),
+        ("covid_requests_total", "counter", "covid .csv requests by cache result"),
+        ("news_term_seconds", "histogram", "time spent requesting the articles of a search term"),
+        ("news_articles_total", "counter", "articles returned by the newsapi per search term"),
+        ("news_errors_total", "counter", "failed newsapi requests per search term"),
+        ("config_read_seconds", "histogram", "time spent reading config.json"),
+        ("config_write_seconds", "histogram", "time spent writing config.json"),
+        ("scheduler_lag_seconds", "histogram", "delay between the planned & actual run of an update"),
+        ("scheduler_job_seconds", "histogram", "time spent running a scheduled update"),
+        ("index_render_seconds", "histogram", "time spent rendering the index page"),
+        ("news_search_seconds", "histogram", "time spent searching the news articles"),
+        ("page_responses_total", "counter", "rendered pages sent, by endpoint & how they were sent"),
+        ("upstream_requests_total", "counter", "requests sent to each upstream"),
+        ("upstream_shared_requests_total", "counter", "requests answered by a request already in progress"),
+        ("upstream_budget_exhausted_total", "counter", "requests not sent as the budget was used up")):
+    METRICS.describe(_name, _type, _help)
@@ -0,0 +1,216 @@
+"""This file deals with storing news articles between updates, with bounded memory use"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+def _digest(text: Optional[str]) -> str:
+    """
+    returns a short hash of a string, used to index titles & contents
+
+    Parameters:
+        text(str): the string to hash, None is treated as an empty string
+
+    Returns:
+        digest(str): 16 hexadecimal characters
+    """
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=8).hexdigest()
+
+class NewsStore:
+    """
+    the news articles shown on the dashboard, in title:content format. Articles with the same
+    content as a stored article are dropped, removed titles are remembered by hash so they are
+    never added again, and both articles & removed titles are capped so memory use stays flat.
+    The store is not thread safe, ui.py only uses it while holding STATE_LOCK
+    """
+
+    def __init__(self, max_articles: int = 200, max_age_days: float = 7, max_deleted: int = 5000):
+        """
+        Parameters:
+            max_articles: maximum number of articles kept, the least recently seen are dropped first
+            max_age_days: articles not seen in an update for this many days are dropped
+            max_deleted: maximum number of removed titles remembered, the oldest are forgotten first
+        """
+        self.max_articles = max_articles
+        self.max_age = max_age_days * 86400
+        self.max_deleted = max_deleted
+        #title -> (content, time last seen, content hash), least recently seen first
+        self._articles = OrderedDict()
+        #content hash -> title, used to drop the same article returned for several terms
+        self._contents = {}
+        #title hashes of removed articles, oldest first
+        self._deleted = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._articles
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """
+        iterates over the stored articles, least recently seen first
+
+        Parameters:
+            None
+
+        Returns:
+            articles(iterator): (title, content) pairs
+        """
+        for title, (content, _, _) in self._articles.items():
+            yield title, content
+
+    def is_deleted(self, title: str) -> bool:
+        """
+        checks whether an article has been removed, in constant time
+
+        Parameters:
+            title(str): title of the article
+
+        Returns:
+            deleted(bool): True if the article was removed
+        """
+        return _digest(title) in self._deleted
+
+    def add_many(self, news: Dict[str, str], now: Optional[float] = None) -> List[str]:
+        """
+        adds the articles returned by news_API_request, skipping removed articles & duplicates.
+        Articles already stored are marked as seen again, then old & excess articles are dropped
+
+        Parameters:
+            news(dict): articles in title:content format
+            now(float): time.time() of the update, defaults to the current time
+
+        Returns:
+            added(list): titles of the articles that were not stored before
+        """
+        now = time.time() if now is None else now
+        added = []
+        for title, content in news.items():
+            content_hash = _digest(content) if content else None
+            if title in self._articles:
+                old_hash = self._articles[title][2]
+                #the content of a stored article changed, index it by its new content
+                if old_hash != content_hash:
+                    if old_hash is not None and self._contents.get(old_hash) == title:
+                        del self._contents[old_hash]
+                    if content_hash is not None:
+                        self._contents.setdefault(content_hash, title)
+                self._articles[title] = (content, now, content_hash)
+                self._articles.move_to_end(title)
+                continue
+            if self.is_deleted(title):
+                continue
+            if content_hash is not None and content_hash in self._contents:
+                continue
+            self._articles[title] = (content, now, content_hash)
+            if content_hash is not None:
+                self._contents[content_hash] = title
+            added.append(title)
+        self.expire(now)
+        return [title for title in added if title in self._articles]
+
+    def remove(self, title: str) -> bool:
+        """
+        removes an article & remembers its title so it is not added again
+
+        Parameters:
+            title(str): title of the article to be removed
+
+        Returns:
+            removed(bool): True if the article was stored
+        """
+        self._deleted[_digest(title)] = None
+        self._deleted.move_to_end(_digest(title))
+        while len(self._deleted) > self.max_deleted:
+            self._deleted.popitem(last=False)
+        return self._drop(title)
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """
+        drops articles that have not been seen for max_age_days, then the least recently seen
+        articles until at most max_articles are left
+
+        Parameters:
+            now(float): the current time.time(), defaults to the current time
+
+        Returns:
+            dropped(list): titles of the dropped articles
+        """
+        now = time.time() if now is None else now
+        dropped = []
+        while self._articles:
+            title, (_, seen, _) = next(iter(self._articles.items()))
+            if len(self._articles) <= self.max_articles and now - seen <= self.max_age:
+                break
+            self._drop(title)
+            dropped.append(title)
+        return dropped
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        converts the store into a compact form for the config file
+
+        Parameters:
+            None
+
+        Returns:
+            data(dict): {"articles": [[title, content, seen], ...], "deleted": [title hash, ...]}
+        """
+        return {"articles": [[title, content, round(seen)]
+                             for title, (content, seen, _) in self._articles.items()],
+                "deleted": list(self._deleted)}
+
+    def load_json(self, data: Dict[str, Any]) -> None:
+        """
+        adds the contents of a store converted with to_json()
+
+        Parameters:
+            data(dict): the output of to_json()
+
+        Returns:
+            None
+        """
+        for title_hash in data.get("deleted", []):
+            self._deleted[title_hash] = None
+        for title, content, seen in sorted(data.get("articles", []), key=lambda article: article[2]):
+            self.add_many({title: content}, seen)
+        while len(self._deleted) > self.max_deleted:
+            self._deleted.popitem(last=False)
+
+    def load_legacy(self, news: Any, deleted_titles: List[str]) -> None:
+        """
+        adds the contents of the "News_articles" & "Deleted_news_articles" config values written
+        by earlier versions, which stored every article & every removed title in full
+
+        Parameters:
+            news: dictionary in title:content format (or an empty list)
+            deleted_titles(list): titles of removed articles
+
+        Returns:
+            None
+        """
+        for title in deleted_titles:
+            self._deleted[_digest(title)] = None
+        if isinstance(news, dict):
+            self.add_many(news)
+        while len(self._deleted) > self.max_deleted:
+            self._deleted.popitem(last=False)
+
+    def _drop(self, title: str) -> bool:
+        """
+        removes an article without remembering its title
+
+        Parameters:
+            title(str): title of the article
+
+        Returns:
+            dropped(bool): True if the article was stored
+        """
+        article = self._articles.pop(title, None)
+        if article is None:
+            return False
+        if article[2] is not None and self._contents.get(article[2]) == title:
+            del self._contents[article[2]]
+        return True
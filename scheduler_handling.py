@@ -0,0 +1,382 @@
+"""This file deals with scheduling updates, indexed by their label"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from metrics_handling import METRICS
+from time_handling import Recurrence, describe_recurrence, parse_recurrence
+
+class ScheduledJob:
+    """
+    a single scheduled call of a function
+
+    Attributes:
+        label(str): unique name of the job, used to cancel it
+        run_at(float): time at which the job is due, in the scheduler's time
+        func(function): function called when the job is due
+        args(tuple): arguments passed to func
+        interval: seconds between runs of a repeating job, or the Recurrence working out
+                  its runs, None if it only runs once
+        cancelled(bool): set when the job is cancelled, it is then skipped & dropped from the heap
+    """
+    __slots__ = ("label", "run_at", "func", "args", "interval", "cancelled")
+
+    def __init__(self, label: str, run_at: float, func: Callable, args: Tuple[Any, ...],
+                 interval: Union[float, Recurrence, None]):
+        self.label = label
+        self.run_at = run_at
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+class UpdateJob(NamedTuple):
+    """
+    a scheduled update as it is persisted in the config file
+
+    Attributes:
+        func_id(str): name of the update function, looked up in a registry of update functions
+        update_time(str): time of day the update runs at, HH:MM 24 hour clock
+        repeat(str): rule the update repeats by, i.e. "daily", "weekdays", "every 15 minutes"
+                     or a cron expression (see time_handling.parse_recurrence), "" if it runs once
+        next_run(float): time.time() of the next run, None if it is not known (older configs)
+    """
+    func_id: str
+    update_time: str
+    repeat: str
+    next_run: Optional[float]
+
+    def describe(self) -> str:
+        """
+        returns the description of the update shown on the dashboard
+
+        Parameters:
+            None
+
+        Returns:
+            description(str): "{function} to {repeat/occur} at {time}", or
+                              "{function} to repeat {rule}" for rules other than daily
+        """
+        if self.repeat and self.repeat != "daily":
+            return f"{self.func_id} to repeat {describe_recurrence(self.repeat, self.update_time)}"
+        return f"{self.func_id} to {'repeat' if self.repeat else 'occur'} at {self.update_time}"
+
+    def recurrence(self, timezone: str = "UTC") -> Optional[Recurrence]:
+        """
+        returns when a repeating update runs
+
+        Parameters:
+            timezone(str): IANA name of the timezone of update_time
+
+        Returns:
+            recurrence(Recurrence): the parsed repeat rule, None if the update runs once
+
+        Raises:
+            ValueError: if the repeat rule is invalid
+        """
+        if not self.repeat:
+            return None
+        return parse_recurrence(self.repeat, self.update_time, timezone)
+
+    def to_json(self) -> List[Any]:
+        """
+        converts the update into the compact form stored in the config file
+
+        Parameters:
+            None
+
+        Returns:
+            data(list): [func_id, update_time, repeat, next_run]
+        """
+        next_run = None if self.next_run is None else round(self.next_run, 3)
+        return [self.func_id, self.update_time, self.repeat, next_run]
+
+    @classmethod
+    def from_json(cls, data: Union[List[Any], str]) -> "UpdateJob":
+        """
+        reads an update stored by to_json(), or stored by earlier versions as a string in
+        the format "{function} to {repeat/occur} at {time}"
+
+        Parameters:
+            data: the stored update
+
+        Returns:
+            job(UpdateJob): the update
+        """
+        if isinstance(data, str):
+            values = data.split(" ")
+            return cls(values[0], values[4], "daily" if values[2] == "repeat" else "", None)
+        func_id, update_time, repeat, next_run = data
+        return cls(func_id, update_time, repeat, next_run)
+
+class LabelScheduler:
+    """
+    thread safe scheduler keeping its jobs in a heap ordered by due time, plus a label -> job
+    index. Adding a job is O(log n), cancelling one by label marks it in O(1) and it is dropped
+    when it reaches the top of the heap (or when cancelled jobs make up half the heap), and
+    repeating jobs are put back on the heap by the scheduler itself
+    """
+
+    def __init__(self, timefunc: Callable[[], float] = time.time):
+        """
+        Parameters:
+            timefunc: returns the current time, time.time unless the scheduler is tested
+        """
+        self.timefunc = timefunc
+        self._heap = []
+        self._jobs = {}
+        self._suffixes = {}
+        self._cancelled = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._jobs)
+
+    def __contains__(self, label: str) -> bool:
+        with self._condition:
+            return label in self._jobs
+
+    def unique_label(self, label: str) -> str:
+        """
+        returns label, or label followed by (number) if a job with that label is scheduled.
+        The last number used for each label is remembered, so no labels are probed twice
+
+        Parameters:
+            label(str): the requested label
+
+        Returns:
+            label(str): a label no scheduled job is using
+        """
+        with self._condition:
+            if label not in self._jobs:
+                return label
+            count = self._suffixes.get(label, 1)
+            while True:
+                count += 1
+                unique = f"{label}({count})"
+                if unique not in self._jobs:
+                    self._suffixes[label] = count
+                    return unique
+
+    def enter(self, label: str, delay: float, func: Callable, args: Tuple[Any, ...] = (),
+              interval: Union[float, Recurrence, None] = None) -> ScheduledJob:
+        """
+        schedules func(*args) to run after delay seconds, replacing any job with the same label
+
+        Parameters:
+            label(str): unique name of the job, see unique_label()
+            delay(float): seconds until the job runs
+            func(function): function to call
+            args(tuple): arguments passed to func
+            interval: if given the job runs again every interval seconds until cancelled,
+                      or at the next fire time of a Recurrence
+
+        Returns:
+            job(ScheduledJob): the scheduled job
+        """
+        return self.enter_many([(label, delay, func, args, interval)])[0]
+
+    def enter_many(self, jobs: List[Tuple[str, float, Callable, Tuple[Any, ...],
+                                          Union[float, Recurrence, None]]]) -> List[ScheduledJob]:
+        """
+        schedules several jobs at once, rebuilding the heap once instead of pushing each job
+
+        Parameters:
+            jobs(list): (label, delay, func, args, interval) for each job, see enter()
+
+        Returns:
+            jobs(list): the scheduled jobs
+        """
+        now = self.timefunc()
+        with self._condition:
+            scheduled = []
+            for label, delay, func, args, interval in jobs:
+                self._cancel(label)
+                job = ScheduledJob(label, now + delay, func, args, interval)
+                self._jobs[label] = job
+                scheduled.append(job)
+            if len(scheduled) > 1:
+                self._heap.extend((job.run_at, next(self._sequence), job) for job in scheduled)
+                heapq.heapify(self._heap)
+            elif scheduled:
+                heapq.heappush(self._heap, (scheduled[0].run_at, next(self._sequence), scheduled[0]))
+            #wake run_forever() in case a new job is due before the one it is waiting for
+            self._condition.notify_all()
+            return scheduled
+
+    def cancel(self, label: str) -> bool:
+        """
+        cancels the job with the given label
+
+        Parameters:
+            label(str): name of the job
+
+        Returns:
+            cancelled(bool): True if a job with that label was scheduled
+        """
+        with self._condition:
+            cancelled = self._cancel(label)
+            self._condition.notify_all()
+            return cancelled
+
+    def cancel_all(self) -> None:
+        """
+        cancels every job, i.e. before the scheduled updates are loaded again from the config
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        with self._condition:
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs = {}
+            self._heap = []
+            self._cancelled = 0
+            self._condition.notify_all()
+
+    def get(self, label: str) -> Optional[ScheduledJob]:
+        """
+        returns the job scheduled with the given label
+
+        Parameters:
+            label(str): name of the job
+
+        Returns:
+            job(ScheduledJob): the job, or None if no job has that label
+        """
+        with self._condition:
+            return self._jobs.get(label)
+
+    def jobs(self) -> Dict[str, ScheduledJob]:
+        """
+        returns every scheduled job
+
+        Parameters:
+            None
+
+        Returns:
+            jobs(dict): label -> job
+        """
+        with self._condition:
+            return dict(self._jobs)
+
+    def next_delay(self) -> Optional[float]:
+        """
+        returns the seconds until the next job is due
+
+        Parameters:
+            None
+
+        Returns:
+            delay(float): seconds until the next job, 0 if it is overdue, None if there are no jobs
+        """
+        with self._condition:
+            self._drop_cancelled()
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self.timefunc())
+
+    def run_pending(self) -> Optional[float]:
+        """
+        runs every job which is due. Repeating jobs are scheduled again before they run,
+        exceptions raised by a job are printed so the other jobs still run.
+        How late each job runs & how long it takes are recorded in METRICS, by function name
+
+        Parameters:
+            None
+
+        Returns:
+            delay(float): seconds until the next job, None if there are no jobs
+        """
+        while True:
+            with self._condition:
+                self._drop_cancelled()
+                if not self._heap or self._heap[0][0] > self.timefunc():
+                    break
+                planned, _, job = heapq.heappop(self._heap)
+                if job.interval is None:
+                    del self._jobs[job.label]
+                else:
+                    #a job which missed several runs only runs once, then keeps its time of day
+                    now = self.timefunc()
+                    if isinstance(job.interval, Recurrence):
+                        #worked out from the clock rather than the previous run, so it never drifts
+                        job.run_at = job.interval.next_fire(max(now, job.run_at))
+                    else:
+                        job.run_at += job.interval
+                        if job.run_at <= now:
+                            job.run_at += job.interval * ((now - job.run_at) // job.interval + 1)
+                    heapq.heappush(self._heap, (job.run_at, next(self._sequence), job))
+            labels = {"job": getattr(job.func, "__name__", "job")}
+            METRICS.observe("scheduler_lag_seconds", max(0.0, self.timefunc() - planned), labels)
+            try:
+                with METRICS.timer("scheduler_job_seconds", labels):
+                    job.func(*job.args)
+            except Exception:
+                traceback.print_exc()
+        return self.next_delay()
+
+    def run_forever(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        runs jobs as they become due until stop is set, meant to be the target of a thread
+
+        Parameters:
+            stop(threading.Event): set to stop the scheduler, it then stops within a second
+
+        Returns:
+            None
+        """
+        while stop is None or not stop.is_set():
+            self.run_pending()
+            with self._condition:
+                delay = self.next_delay()
+                if delay == 0:
+                    continue
+                #enter() & cancel() wake the wait early, check stop at least once a second
+                if stop is not None:
+                    delay = 1.0 if delay is None else min(delay, 1.0)
+                self._condition.wait(delay)
+
+    def _cancel(self, label: str) -> bool:
+        """
+        marks the job with the given label as cancelled, the condition must already be held
+
+        Parameters:
+            label(str): name of the job
+
+        Returns:
+            cancelled(bool): True if a job with that label was scheduled
+        """
+        job = self._jobs.pop(label, None)
+        if job is None:
+            return False
+        job.cancelled = True
+        self._cancelled += 1
+        #rebuild the heap once cancelled jobs make up half of it, so it never fills up with them
+        if self._cancelled * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return True
+
+    def _drop_cancelled(self) -> None:
+        """
+        pops cancelled jobs off the top of the heap, the condition must already be held
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
@@ -0,0 +1,274 @@
+"""This file deals with searching the news articles shown on the dashboard"""
+
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+
+#words are runs of letters & digits, compared in lower case
+_WORD = re.compile(r"[^\W_]+")
+#common words which would match nearly every article
+STOP_WORDS = frozenset("a an and are as at be but by for from has have in is it its of on or "
+                       "that the their this to was were will with".split())
+#a word in the title counts as this many words in the content
+TITLE_WEIGHT = 3
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    splits a text into the words which are indexed & searched for
+
+    Parameters:
+        text(str): the text to split, None is treated as an empty string
+
+    Returns:
+        words(list): lower case words without stop words, in the order of the text
+    """
+    return [word for word in _WORD.findall((text or "").lower()) if word not in STOP_WORDS]
+
+class SearchIndex:
+    """
+    thread safe inverted index over the titles & contents of news articles, ranked with BM25.
+    Articles are added & removed one at a time, so the index never has to be rebuilt from all
+    articles: a removed article is only marked as removed (a tombstone) & skipped by searches,
+    its postings are dropped once tombstones make up a large part of the index.
+    The BM25 weight of each posting is computed when the article is added & the postings of
+    a word are copied into numpy arrays the first time it is searched for after a change,
+    so a search adds up a few arrays instead of looping over every matching article
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_results: int = 256):
+        """
+        Parameters:
+            k1: BM25 term frequency saturation, higher values reward repeated words more
+            b: BM25 length normalisation, 0 ignores the length of articles, 1 normalises fully
+            max_results: number of recent searches whose results are kept until the index changes
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_results = max_results
+        #incremented by every change, searches cached for an older version are computed again
+        self.version = 0
+        #document id -> (title, content) of every article that has not been removed
+        self._articles = {}
+        #title -> document id
+        self._ids = {}
+        #word -> {document id: BM25 weight of the word in the article}
+        self._postings = {}
+        #word -> (document ids, weights) arrays of _postings, dropped when the word's postings change
+        self._arrays = {}
+        #document id -> number of words in the article, titles counted TITLE_WEIGHT times
+        self._lengths = {}
+        self._total_length = 0
+        #document ids of removed articles which are still in _postings
+        self._tombstones = set()
+        #True for every document id of an article that has not been removed
+        self._alive = np.zeros(64, dtype=bool)
+        self._next_id = 0
+        #(version, words, limit) -> results of recent searches, oldest first
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._articles)
+
+    def terms(self) -> int:
+        """
+        returns the number of distinct words in the index, reported by /metrics
+
+        Parameters:
+            None
+
+        Returns:
+            terms(int): number of words with postings, words only found in removed articles included
+        """
+        with self._lock:
+            return len(self._postings)
+
+    def add(self, title: str, content: Optional[str]) -> None:
+        """
+        adds an article, replacing the stored article with the same title if its content changed
+
+        Parameters:
+            title(str): title of the article
+            content(str): content of the article, may be None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            doc_id = self._ids.get(title)
+            if doc_id is not None:
+                if self._articles[doc_id][1] == content:
+                    return
+                self._remove(title)
+            self._index(self._next_id, title, content)
+            self._next_id += 1
+            self.version += 1
+
+    def remove(self, title: str) -> bool:
+        """
+        removes an article, its postings stay in the index as a tombstone until it is compacted
+
+        Parameters:
+            title(str): title of the article
+
+        Returns:
+            removed(bool): True if the article was in the index
+        """
+        with self._lock:
+            return self._remove(title)
+
+    def search(self, query: str, limit: int = 10) -> Tuple[int, List[Tuple[str, str, float]]]:
+        """
+        finds the articles containing any word of a query, articles containing more of the
+        words, rarer words or words in their title rank first
+
+        Parameters:
+            query(str): words to search for
+            limit(int): maximum number of articles returned
+
+        Returns:
+            total(int): number of matching articles
+            results(list): (title, content, score) of the best matching articles, best first
+        """
+        words = tuple(sorted(set(tokenize(query))))
+        with self._lock:
+            key = (self.version, words, limit)
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return cached
+            #removed articles still count towards the number of articles containing a word,
+            #so the number of articles includes them too
+            documents = len(self._articles) + len(self._tombstones)
+            scores = np.zeros(self._next_id)
+            for word in words:
+                if word not in self._postings:
+                    continue
+                doc_ids, weights = self._word_arrays(word)
+                idf = math.log(1 + (documents - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+                #a word is in each article once, so no document id repeats within doc_ids
+                scores[doc_ids] += idf * weights
+            scores[~self._alive[:self._next_id]] = 0
+            matches = np.flatnonzero(scores)
+            if len(matches) > limit:
+                matches = matches[np.argpartition(scores[matches], -limit)[-limit:]]
+            matches = matches[np.argsort(-scores[matches], kind="stable")]
+            result = (int(np.count_nonzero(scores)),
+                      [(*self._articles[doc_id], float(scores[doc_id])) for doc_id in matches.tolist()])
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return result
+
+    def _word_arrays(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        returns the postings of a word as arrays, copied from _postings if they changed
+
+        Parameters:
+            word(str): a word with postings
+
+        Returns:
+            doc_ids(np.ndarray): document ids of the articles containing the word
+            weights(np.ndarray): BM25 weight of the word in each of these articles
+        """
+        arrays = self._arrays.get(word)
+        if arrays is None:
+            postings = self._postings[word]
+            arrays = (np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                      np.fromiter(postings.values(), dtype=np.float64, count=len(postings)))
+            self._arrays[word] = arrays
+        return arrays
+
+    def _weight(self, count: int, length: int) -> float:
+        """
+        returns the BM25 weight of a word in an article, without the rarity of the word (idf)
+        which changes with every article added & is applied by search(). The average length of
+        the articles indexed so far is used, the weights are computed again on compaction
+
+        Parameters:
+            count(int): number of times the word is in the article
+            length(int): number of words in the article
+
+        Returns:
+            weight(float): the weight of the word
+        """
+        average = self._total_length / len(self._lengths) if self._lengths else length
+        norm = self.k1 * (1 - self.b + self.b * length / (average or 1))
+        return count * (self.k1 + 1) / (count + norm)
+
+    def _index(self, doc_id: int, title: str, content: Optional[str]) -> None:
+        """
+        adds the postings of an article. Must be called holding the lock
+
+        Parameters:
+            doc_id(int): document id of the article, not used by any other article
+            title(str): title of the article
+            content(str): content of the article, may be None
+
+        Returns:
+            None
+        """
+        #an article without content (the newsapi often returns null) is found by its title
+        words = Counter(tokenize(title) * TITLE_WEIGHT + tokenize(content))
+        length = sum(words.values())
+        self._articles[doc_id] = (title, content)
+        self._ids[title] = doc_id
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for word, count in words.items():
+            self._postings.setdefault(word, {})[doc_id] = self._weight(count, length)
+            self._arrays.pop(word, None)
+        if doc_id >= len(self._alive):
+            self._alive = np.concatenate((self._alive, np.zeros(len(self._alive), dtype=bool)))
+        self._alive[doc_id] = True
+
+    def _remove(self, title: str) -> bool:
+        """
+        remove() without taking the lock
+
+        Parameters:
+            title(str): title of the article
+
+        Returns:
+            removed(bool): True if the article was in the index
+        """
+        doc_id = self._ids.pop(title, None)
+        if doc_id is None:
+            return False
+        del self._articles[doc_id]
+        self._total_length -= self._lengths.pop(doc_id)
+        self._tombstones.add(doc_id)
+        self._alive[doc_id] = False
+        self.version += 1
+        #compact once the tombstones outnumber half of the articles, so searches skip few of them
+        if len(self._tombstones) > max(64, len(self._articles) // 2):
+            self._compact()
+        return True
+
+    def _compact(self) -> None:
+        """
+        rebuilds the index without the removed articles, numbering the articles from 0 again
+        & computing the weights from the current average length. Must be called holding the lock
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        articles = list(self._articles.values())
+        self._articles = {}
+        self._ids = {}
+        self._postings = {}
+        self._arrays = {}
+        self._lengths = {}
+        self._total_length = 0
+        self._tombstones = set()
+        self._alive = np.zeros(max(64, 2 * len(articles)), dtype=bool)
+        for doc_id, (title, content) in enumerate(articles):
+            self._index(doc_id, title, content)
+        self._next_id = len(articles)
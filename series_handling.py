@@ -0,0 +1,219 @@
+"""This file deals with keeping the covid time series of every area in memory & querying them"""
+
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+
+#series field (Cov19API metric name) -> (column in the columnar data, how days are combined
+#into a week). Cases are daily counts so they are summed, hospital cases are a daily level
+#so they are averaged, and deaths are cumulative so the last day of the week is kept
+SERIES_FIELDS = {"newCasesBySpecimenDate": ("cases", "sum"),
+                 "hospitalCases": ("hospital", "mean"),
+                 "cumDailyNsoDeathsByDeathDate": ("deaths", "last")}
+
+#valid values of the aggregate parameter of query_series
+AGGREGATIONS = ["daily", "weekly", "rolling"]
+
+class Series(NamedTuple):
+    """
+    the time series of a single area, on a contiguous daily grid with the oldest day first
+
+    Attributes:
+        version(int): incremented every time the series of the area is replaced
+        dates(np.ndarray): datetime64[D] value of every day
+        values(dict): series field -> float64 array with nan for days without data
+    """
+    version: int
+    dates: np.ndarray
+    values: Dict[str, np.ndarray]
+
+def _daily_grid(columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    reorders columnar data oldest day first & fills missing days with nan, so that a date
+    range can be found with a binary search and a window of n rows is always n days
+
+    Parameters:
+        columns(dict): columnar data, see covid_data_handler.parse_covid_csv_columns
+
+    Returns:
+        dates(np.ndarray): every day from the first to the last day of the data
+        values(dict): series field -> values of each day
+    """
+    if columns["date"].size == 0:
+        return np.array([], dtype="datetime64[D]"), {field: np.array([], dtype=np.float64)
+                                                     for field in SERIES_FIELDS}
+    first = columns["date"].min()
+    dates = np.arange(first, columns["date"].max() + np.timedelta64(1, "D"), dtype="datetime64[D]")
+    rows = (columns["date"] - first).astype(np.int64)
+    values = {}
+    for field, (column, _) in SERIES_FIELDS.items():
+        grid = np.full(dates.size, np.nan)
+        grid[rows] = columns[column]
+        grid.setflags(write=False)
+        values[field] = grid
+    dates.setflags(write=False)
+    return dates, values
+
+class SeriesStore:
+    """
+    thread safe store holding the full time series of every area in memory, filled by
+    covid_data_handler whenever a series is requested or loaded. Series are read-only once
+    stored and replaced as a whole, so readers use them without holding the lock
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def put(self, area: Tuple[str, str], columns: Dict[str, np.ndarray]) -> Series:
+        """
+        replaces the series of an area
+
+        Parameters:
+            area(tuple): (areaType, areaName)
+            columns(dict): columnar data, see covid_data_handler.parse_covid_csv_columns
+
+        Returns:
+            series(Series): the stored series
+        """
+        dates, values = _daily_grid(columns)
+        with self._lock:
+            self._version += 1
+            series = Series(self._version, dates, values)
+            self._series[area] = series
+        return series
+
+    def get(self, area: Tuple[str, str]) -> Optional[Series]:
+        """
+        returns the series of an area
+
+        Parameters:
+            area(tuple): (areaType, areaName)
+
+        Returns:
+            series(Series): the stored series, None if no series is stored for the area
+        """
+        return self._series.get(area)
+
+#series shared by covid_data_handler & ui
+SERIES_STORE = SeriesStore()
+
+def _window_means(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    computes the mean of every window of days ending on each day, ignoring days without data
+
+    Parameters:
+        values(np.ndarray): values of each day, nan for days without data
+        window(int): number of days in each window
+
+    Returns:
+        means(np.ndarray): means[i] is the mean of days i - window + 1 to i, nan if none of these
+                           days have data. The first window - 1 days use the days available
+    """
+    present = ~np.isnan(values)
+    totals = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    starts = np.maximum(np.arange(values.size) + 1 - window, 0)
+    sums = totals[1:] - totals[starts]
+    days = counts[1:] - counts[starts]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(days > 0, sums / days, np.nan)
+
+def _bucket_reduce(values: np.ndarray, starts: np.ndarray, how: str) -> np.ndarray:
+    """
+    combines consecutive runs of days into one value each, ignoring days without data
+
+    Parameters:
+        values(np.ndarray): values of each day, nan for days without data
+        starts(np.ndarray): index of the first day of each run, in increasing order
+        how(str): "sum", "mean" or "last" (the last day with data)
+
+    Returns:
+        reduced(np.ndarray): one value per run, nan for runs without any data
+    """
+    present = ~np.isnan(values)
+    days = np.add.reduceat(present.astype(np.int64), starts)
+    if how == "last":
+        #index of the last day with data up to each day, read at the last day of every run
+        last = np.maximum.accumulate(np.where(present, np.arange(values.size), -1))
+        ends = np.append(starts[1:], values.size) - 1
+        return np.where(days > 0, values[np.maximum(last[ends], 0)], np.nan)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+    if how == "sum":
+        return np.where(days > 0, sums, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(days > 0, sums / days, np.nan)
+
+def query_series(series: Series, fields: Optional[List[str]] = None, start: Optional[str] = None,
+                 end: Optional[str] = None, aggregate: str = "daily", window: int = 7,
+                 points: Optional[int] = None) -> Dict[str, Any]:
+    """
+    slices, aggregates & downsamples a series with vectorized operations
+
+    Parameters:
+        series(Series): the series of an area, see SeriesStore.get
+        fields(list): series fields to return, defaults to every field in SERIES_FIELDS
+        start(str): first day to return (YYYY-MM-DD), defaults to the first stored day
+        end(str): last day to return (YYYY-MM-DD), defaults to the last stored day
+        aggregate(str): "daily" returns the value of each day, "weekly" combines each week
+                        starting on a Monday (see SERIES_FIELDS), "rolling" returns the mean
+                        of the window days ending on each day
+        window(int): number of days averaged by "rolling"
+        points(int): maximum number of values returned per field, consecutive values are
+                     averaged into buckets if there are more. None returns every value
+
+    Returns:
+        result(dict): {"dates": [YYYY-MM-DD, ...], field: [value or None, ...], ...}, for weekly
+                      data & buckets the date is the first day they cover
+
+    Raises:
+        ValueError: if a parameter is invalid
+    """
+    fields = list(SERIES_FIELDS) if not fields else fields
+    for field in fields:
+        if field not in SERIES_FIELDS:
+            raise ValueError(f"{field} is not a valid field, valid fields are: {list(SERIES_FIELDS)}")
+    if aggregate not in AGGREGATIONS:
+        raise ValueError(f"{aggregate} is not a valid aggregate, valid values are: {AGGREGATIONS}")
+    if window < 1 or (points is not None and points < 1):
+        raise ValueError("window and points must be at least 1")
+    try:
+        start_day = None if start is None else np.datetime64(start, "D")
+        end_day = None if end is None else np.datetime64(end, "D")
+    except ValueError:
+        raise ValueError("start and end must be dates formatted as YYYY-MM-DD") from None
+
+    #rolling means include the days before start, so the slice is only taken afterwards
+    first = 0 if start_day is None else int(np.searchsorted(series.dates, start_day, "left"))
+    last = series.dates.size if end_day is None else int(np.searchsorted(series.dates, end_day, "right"))
+    first = min(first, last)
+    dates = series.dates[first:last]
+    values = {}
+    for field in fields:
+        if aggregate == "rolling":
+            values[field] = _window_means(series.values[field][:last], window)[first:]
+        else:
+            values[field] = series.values[field][first:last]
+
+    if aggregate == "weekly" and dates.size:
+        #1970-01-01 was a Thursday, so day + 3 counts weeks starting on a Monday
+        weeks = (dates.astype(np.int64) + 3) // 7
+        starts = np.flatnonzero(np.diff(weeks, prepend=weeks[0] - 1))
+        dates = dates[starts]
+        values = {field: _bucket_reduce(column, starts, SERIES_FIELDS[field][1])
+                  for field, column in values.items()}
+
+    if points is not None and dates.size > points:
+        starts = (np.arange(points) * dates.size) // points
+        dates = dates[starts]
+        values = {field: _bucket_reduce(column, starts, "mean") for field, column in values.items()}
+
+    result = {"dates": np.datetime_as_string(dates).tolist()}
+    for field, column in values.items():
+        rounded = np.round(column, 2)
+        result[field] = np.where(np.isnan(rounded), None, rounded).tolist()
+    return result
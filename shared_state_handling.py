@@ -0,0 +1,178 @@
+"""This file deals with sharing the dashboard between several worker processes through SQLite"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+#seconds a leader stays leader without renewing its lease, after which another worker takes over
+LEASE_SECONDS = 15.0
+
+class SharedState:
+    """
+    SQLite database shared by the worker processes of the dashboard. It holds:
+        the latest snapshot of the dashboard, written by the leader & read by every worker
+        the leader lease, so exactly one worker runs the scheduler & requests data
+        a queue of changes (i.e. a dismissed article) made on other workers, applied by the leader
+    Each thread uses its own connection, the database runs in WAL mode so reading the snapshot
+    never waits for the leader writing it
+    """
+
+    def __init__(self, filename: str = "dashboard_state.db", owner: Optional[str] = None):
+        """
+        Parameters:
+            filename: path of the SQLite database, created if it does not exist
+            owner: name of this worker in the leader lease, defaults to host & process id
+        """
+        self.filename = filename
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshot (id INTEGER PRIMARY KEY CHECK (id = 1),
+                                                 version INTEGER NOT NULL, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS lease (id INTEGER PRIMARY KEY CHECK (id = 1),
+                                              owner TEXT NOT NULL, expires REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS changes (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                                action TEXT NOT NULL, args TEXT NOT NULL);
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        returns the connection of the current thread, opened on first use. Connections are
+        opened after the worker processes are forked, so no connection is shared by processes
+
+        Parameters:
+            None
+
+        Returns:
+            connection(sqlite3.Connection): connection in autocommit mode
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def try_lead(self, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """
+        takes the leader lease if it is free or expired, or renews it if this worker holds it
+
+        Parameters:
+            lease_seconds: seconds until the lease expires if it is not renewed
+
+        Returns:
+            leader(bool): True if this worker is the leader
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT owner, expires FROM lease WHERE id = 1").fetchone()
+            leader = row is None or row[0] == self.owner or row[1] < now
+            if leader:
+                connection.execute("INSERT INTO lease (id, owner, expires) VALUES (1, ?, ?) "
+                                   "ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, "
+                                   "expires = excluded.expires", (self.owner, now + lease_seconds))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return leader
+
+    def resign(self) -> None:
+        """
+        gives up the leader lease if this worker holds it, so another worker takes over at once
+
+        Parameters:
+            None
+
+        Returns:
+            None
+        """
+        self._connection().execute("DELETE FROM lease WHERE id = 1 AND owner = ?", (self.owner,))
+
+    def write_snapshot(self, data: Dict[str, Any]) -> None:
+        """
+        replaces the snapshot, only called by the leader
+
+        Parameters:
+            data(dict): the dashboard state, converted into json
+
+        Returns:
+            None
+        """
+        self._connection().execute(
+            "INSERT INTO snapshot (id, version, data) VALUES (1, 1, ?) ON CONFLICT(id) DO UPDATE "
+            "SET version = snapshot.version + 1, data = excluded.data",
+            (json.dumps(data, separators=(",", ":")),))
+
+    def snapshot_version(self) -> int:
+        """
+        returns the version of the snapshot, cheap enough to check on every request
+
+        Parameters:
+            None
+
+        Returns:
+            version(int): incremented by every write_snapshot(), 0 if nothing has been written
+        """
+        row = self._connection().execute("SELECT version FROM snapshot WHERE id = 1").fetchone()
+        return 0 if row is None else row[0]
+
+    def read_snapshot(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        returns the snapshot written by the leader
+
+        Parameters:
+            None
+
+        Returns:
+            version(int): version of the snapshot, 0 if nothing has been written
+            data(dict): the dashboard state, None if nothing has been written
+        """
+        row = self._connection().execute("SELECT version, data FROM snapshot WHERE id = 1").fetchone()
+        if row is None:
+            return 0, None
+        return row[0], json.loads(row[1])
+
+    def push_change(self, action: str, args: List[Any]) -> None:
+        """
+        queues a change for the leader to apply
+
+        Parameters:
+            action(str): name of the change, i.e. "remove_news_article"
+            args(list): json serialisable arguments of the change
+
+        Returns:
+            None
+        """
+        self._connection().execute("INSERT INTO changes (action, args) VALUES (?, ?)",
+                                   (action, json.dumps(args)))
+
+    def take_changes(self) -> List[Tuple[str, List[Any]]]:
+        """
+        removes & returns every queued change, in the order they were queued
+
+        Parameters:
+            None
+
+        Returns:
+            changes(list): (action, args) of each change
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("SELECT id, action, args FROM changes ORDER BY id").fetchall()
+            if rows:
+                connection.execute("DELETE FROM changes WHERE id <= ?", (rows[-1][0],))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [(action, json.loads(args)) for _, action, args in rows]
@@ -0,0 +1,6 @@
+"""Shared set up of the tests, the dashboard modules are imported from the folder above"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,20 @@
+"""Tests of the news search index"""
+
+from search_handling import SearchIndex
+
+def test_article_without_content_is_found_by_title():
+    index = SearchIndex()
+    index.add("A title", None)
+    index.add("B title", "b content")
+
+    total, results = index.search("title")
+    assert total == 2
+    assert {title for title, _, _ in results} == {"A title", "B title"}
+    assert index.search("content")[1][0][0] == "B title"
+
+def test_removed_article_is_not_found():
+    index = SearchIndex()
+    index.add("A title", None)
+    index.remove("A title")
+
+    assert index.search("title") == (0, [])
@@ -0,0 +1,24 @@
+"""Tests of the repeat rules of scheduled updates"""
+
+import pytest
+from time_handling import parse_recurrence
+
+@pytest.mark.parametrize("rule", ["monkey", "sunshine", "wedding", "tues", "mon,fridays"])
+def test_words_starting_with_a_day_are_refused(rule):
+    with pytest.raises(ValueError):
+        parse_recurrence(rule, "08:00")
+
+def test_day_lists_accept_abbreviated_and_full_names():
+    assert parse_recurrence("mon,wed,fri", "08:00").weekdays == frozenset((0, 2, 4))
+    assert parse_recurrence("Monday, Sunday", "08:00").weekdays == frozenset((0, 6))
+
+def test_intervals_which_do_not_divide_a_day_keep_their_phase():
+    recurrence = parse_recurrence("every 7 hours", "08:30", "Europe/London")
+    parse_recurrence.cache_clear()
+    #read again, as after a restart on another day
+    assert parse_recurrence("every 7 hours", "08:30", "Europe/London").anchor == recurrence.anchor
+    #steps of 7 hours from 2000-01-01 08:30 in London (GMT, so 08:30 UTC)
+    after = 1614587400
+    fire = recurrence.next_fire(after)
+    assert 0 < fire - after <= 7 * 3600
+    assert (fire - 946715400) % (7 * 3600) == 0
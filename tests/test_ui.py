@@ -0,0 +1,114 @@
+"""Tests of the website served by ui.py, run with the Cov19API & the newsapi replaced"""
+
+import functools
+import json
+import os
+import pytest
+import requests
+import covid_data_handler
+import covid_news_handling
+import ui
+from cache_handling import RESPONSE_CACHE
+from config_handling import CONFIG
+
+#config shipped with the dashboard, copied into a temporary folder by the tests
+CONFIG_COPY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "config - Copy.json")
+
+class DownCov19API:
+    """
+    stands in for Cov19API while the Cov19API can't be reached
+    """
+
+    def __init__(self, filters, structure):
+        self.filters = filters
+
+    @staticmethod
+    def get_release_timestamp():
+        raise requests.ConnectionError("the Cov19API is down")
+
+    def get_csv(self, save_as=None):
+        raise requests.ConnectionError("the Cov19API is down")
+
+def _down_news_session(*args, **kwargs):
+    """
+    stands in for SESSION.get while the newsapi can't be reached
+    """
+    raise requests.ConnectionError("the newsapi is down")
+
+@pytest.fixture
+def dashboard(tmp_path, monkeypatch):
+    """
+    starts the dashboard from the shipped config in a temporary folder, without fresh data
+    """
+    monkeypatch.chdir(tmp_path)
+    with open(CONFIG_COPY, "r", encoding="utf-8") as json_file:
+        CONFIG.replace(json.load(json_file))
+    monkeypatch.setattr(CONFIG, "filename", str(tmp_path / "config.json"))
+    RESPONSE_CACHE.clear()
+    for event in ui.READY.values():
+        event.clear()
+    ui.startup()
+    yield ui.app.test_client()
+    RESPONSE_CACHE.clear()
+
+def test_ready_while_upstreams_are_down(dashboard, monkeypatch):
+    monkeypatch.setattr(ui, "covid_API_batch_request",
+                        functools.partial(covid_data_handler.covid_API_batch_request,
+                                          api_class=DownCov19API))
+    monkeypatch.setattr(covid_news_handling.SESSION, "get", _down_news_session)
+    ui._warm_up("covid_data", ui.update_covid_data)
+    ui._warm_up("news", ui.update_news)
+
+    response = dashboard.get("/ready")
+    assert response.status_code == 503
+    assert response.get_json() == {"covid_data": False, "news": False, "ready": False}
+
+class UpCov19API(DownCov19API):
+    """
+    stands in for Cov19API, answering every request with the same two days of figures
+    """
+
+    @staticmethod
+    def get_release_timestamp():
+        return "2021-12-01T16:00:00.000000Z"
+
+    def get_csv(self, save_as=None):
+        return ("date,areaName,newCasesBySpecimenDate,hospitalCases,cumDailyNsoDeathsByDeathDate\n"
+                "2021-12-01,Exeter,120,30,\n"
+                "2021-11-30,Exeter,110,31,250\n")
+
+class NewsResponse:
+    """
+    stands in for the response of the newsapi to a search
+    """
+    status_code = 200
+    headers = {}
+    content = b"{}"
+
+    @staticmethod
+    def json():
+        return {"status": "ok", "articles": [{"title": "Covid news", "content": "content"}]}
+
+def test_ready_once_fresh_data_loaded(dashboard, monkeypatch):
+    monkeypatch.setattr(ui, "covid_API_batch_request",
+                        functools.partial(covid_data_handler.covid_API_batch_request,
+                                          api_class=UpCov19API))
+    monkeypatch.setattr(covid_news_handling.SESSION, "get", lambda *args, **kwargs: NewsResponse())
+    assert dashboard.get("/ready").status_code == 503
+    ui._warm_up("covid_data", ui.update_covid_data)
+    ui._warm_up("news", ui.update_news)
+
+    response = dashboard.get("/ready")
+    assert response.status_code == 200
+    assert response.get_json() == {"covid_data": True, "news": True, "ready": True}
+
+def test_search_finds_article_without_content(dashboard):
+    with ui.STATE_LOCK:
+        ui.NEWS_STORE.add_many({"A title": None, "B title": "b content"})
+        ui.publish_state()
+
+    response = dashboard.get("/api/news/search?q=title")
+    assert response.status_code == 200
+    assert response.get_json()["total"] == 2
+    assert {result["title"] for result in response.get_json()["results"]} == {"A title", "B title"}
@@ -1,6 +1,14 @@
-"""Functions to deal with time, mainly converting 24H clock format to seconds"""
+"""Functions to deal with time, mainly converting 24H clock format to seconds & working out
+when repeating updates run"""
 
+import math
+import re
 import time
+from bisect import bisect_right
+from datetime import date, datetime, timezone as dt_timezone, tzinfo
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 def time_to_seconds(time_24h: str) -> int:
     """
@@ -14,53 +22,398 @@ def time_to_seconds(time_24h: str) -> int:
         seconds(int): an integer representing seconds
     """
     #check validity of given time
-    if len(time_24h.split(':')) != 2:
+    hours, separator, minutes = time_24h.partition(':')
+    if not separator or ':' in minutes:
         print('Incorrect format. Argument must be formatted as HH:MM')
         return None
-    return 60*60*(int(time_24h.split(':')[0])) + 60*(int(time_24h.split(':')[1]))
+    return 60*60*int(hours) + 60*int(minutes)
 
-def current_time_func() -> str:
+def current_time_func(timezone: str = "UTC") -> str:
     """
     returns the current time in a HH:MM format
 
     Parameters:
-        None
+        timezone(str): IANA name of the timezone, i.e. "Europe/London"
 
     Returns:
         time(str): The current time in the format HH:MM
     """
-    #get current hour as a string
-    hour = str(time.gmtime().tm_hour)
-    if len(hour) == 1:
-        hour = f"0{hour}"
+    return datetime.now(get_timezone(timezone)).strftime("%H:%M")
 
-    #get current minute as a string
-    minute = str(time.gmtime().tm_min)
-    if len(minute) == 1:
-        minute = f"0{minute}"
-
-    return f"{hour}:{minute}"
-
-def update_interval_func(scheduled_time: str) -> int:
+def update_interval_func(scheduled_time: str, timezone: str = "UTC") -> int:
     """
-    Calculates the number of seconds between the current time and a given time
+    Calculates the number of seconds between the current time and the next time the clock
+    shows a given time, a time in the current minute counts as now
 
     Parameters:
         Scheduled_time(str): a given time in the format HH:MM
+        timezone(str): IANA name of the timezone of scheduled_time
 
     returns:
         update_interval(int): an integer representing the difference between scheduled_time
-                              and the current time in seconds
-    """
-    current_time = time_to_seconds(current_time_func())
-    scheduled_time = time_to_seconds(scheduled_time)
-    update_interval = scheduled_time - current_time
-
-    if update_interval > 0:
-        return update_interval
-    #if update interval = 0, scheduled time = given time, so
-    if update_interval == 0:
-        return 1
-    #update interval is negative, scheduled time was set as a time which already passed today.
-    #Add 24H to set it for tomorrow at the scheduled time
-    return update_interval + time_to_seconds("24:00")
+                              and the current time in seconds, at least 1
+    """
+    return math.ceil(parse_recurrence("daily", scheduled_time, timezone).delay())
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str) -> tzinfo:
+    """
+    returns a timezone by name, UTC does not need the timezone database
+
+    Parameters:
+        name(str): IANA name of the timezone, i.e. "Europe/London"
+
+    Returns:
+        timezone(tzinfo): the timezone
+
+    Raises:
+        ValueError: if the timezone is unknown
+    """
+    if name.upper() == "UTC":
+        return dt_timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown timezone {name}") from None
+
+#minutes in a day, a recurrence fires at a set of minutes of the day
+MINUTES_PER_DAY = 1440
+#days searched for the next fire time before a recurrence is treated as never firing
+MAX_SEARCH_DAYS = 4 * 366
+#fire times computed at once & kept by each recurrence
+PRECOMPUTED_FIRES = 32
+#local date intervals which do not divide a day are counted from, so they fire at the same
+#times however long the process has been running & whichever day it was started on
+INTERVAL_EPOCH = date(2000, 1, 1)
+
+_DAY_NAMES = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+#days of a day list rule, abbreviated or in full
+_DAY_LIST_NAMES = {**_DAY_NAMES, **{name: number for number, name in enumerate(
+    "monday tuesday wednesday thursday friday saturday sunday".split())}}
+_MONTH_NAMES = {name: number for number, name in enumerate(
+    "jan feb mar apr may jun jul aug sep oct nov dec".split(), 1)}
+_EVERY = re.compile(r"every\s+(\d+)\s*(m|min|mins|minute|minutes|h|hour|hours)$")
+
+class Recurrence:
+    """
+    when a repeating update runs: at a set of minutes of the day (local wall clock time in a
+    timezone, so clocks changing for daylight saving time do not move it), on the days matching
+    a cron style filter, or every fixed number of seconds if the interval does not divide a day.
+    Fire times are computed from the wall clock each time instead of adding an interval to the
+    previous run, so they never drift. The next PRECOMPUTED_FIRES fire times are kept, so
+    looking up the next fire times again is a binary search. Build one with parse_recurrence()
+    """
+
+    def __init__(self, times: Tuple[int, ...] = (), months: Optional[frozenset] = None,
+                 days: Optional[frozenset] = None, weekdays: Optional[frozenset] = None,
+                 timezone: str = "UTC", interval: Optional[float] = None, anchor: float = 0.0):
+        """
+        Parameters:
+            times: sorted minutes of the day it fires at
+            months: months (1-12) it fires in, None for every month
+            days: days of the month (1-31) it fires on, None for every day
+            weekdays: days of the week (0 for monday to 6) it fires on, None for every day.
+                      Like cron, if both days & weekdays are given a day matching either counts
+            timezone: IANA name of the timezone of times
+            interval: seconds between fires, used instead of times & the days if given
+            anchor: time.time() of one of the fires of an interval
+        """
+        self.times = tuple(times)
+        self.months = months
+        self.days = days
+        self.weekdays = weekdays
+        self.timezone = timezone
+        self.tz = get_timezone(timezone)
+        self.interval = interval
+        self.anchor = anchor
+        #(time the fires were computed after, fire times), replaced as a whole so threads
+        #sharing the recurrence never see a half written cache
+        self._fires = (math.inf, ())
+
+    def _key(self) -> Tuple:
+        return (self.times, self.months, self.days, self.weekdays, self.timezone,
+                self.interval, self.anchor if self.interval else 0.0)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Recurrence) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def next_fire(self, after: Optional[float] = None) -> float:
+        """
+        returns the first fire time after a given time
+
+        Parameters:
+            after(float): time.time() to start from, defaults to now
+
+        Returns:
+            fire(float): time.time() of the next fire, strictly after after
+        """
+        return self.next_fires(after, 1)[0]
+
+    def next_fires(self, after: Optional[float] = None, count: int = 1) -> List[float]:
+        """
+        returns the next fire times after a given time, from the precomputed fire times
+        if they cover the request
+
+        Parameters:
+            after(float): time.time() to start from, defaults to now
+            count(int): number of fire times
+
+        Returns:
+            fires(list): time.time() of the next count fires, in order
+
+        Raises:
+            ValueError: if the recurrence does not fire within MAX_SEARCH_DAYS (i.e. 30th of February)
+        """
+        after = time.time() if after is None else after
+        start, fires = self._fires
+        if start <= after:
+            index = bisect_right(fires, after)
+            if index + count <= len(fires):
+                return list(fires[index:index + count])
+        fires = []
+        for fire in self._generate(after):
+            fires.append(fire)
+            if len(fires) >= max(count, PRECOMPUTED_FIRES):
+                break
+        if len(fires) < count:
+            raise ValueError("the recurrence never fires")
+        self._fires = (after, tuple(fires))
+        return fires[:count]
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """
+        returns the seconds until the next fire, a fire in the current minute counts as now,
+        so an update scheduled for the current time runs straight away
+
+        Parameters:
+            now(float): the current time.time(), defaults to the current time
+
+        Returns:
+            delay(float): seconds until the next fire, at least 1
+        """
+        now = time.time() if now is None else now
+        return max(1.0, self.next_fire(now // 60 * 60 - 0.001) - now)
+
+    def _matches(self, day: date) -> bool:
+        """
+        checks whether the recurrence fires on a day
+
+        Parameters:
+            day(date): the local date
+
+        Returns:
+            matches(bool): True if the day matches the months, days & weekdays
+        """
+        if self.months is not None and day.month not in self.months:
+            return False
+        if self.days is not None and self.weekdays is not None:
+            return day.day in self.days or day.weekday() in self.weekdays
+        if self.days is not None and day.day not in self.days:
+            return False
+        return self.weekdays is None or day.weekday() in self.weekdays
+
+    def _generate(self, after: float) -> Iterator[float]:
+        """
+        yields the fire times after a given time, in order
+
+        Parameters:
+            after(float): time.time() to start from
+
+        Returns:
+            fires(iterator): time.time() of each fire, strictly after after
+        """
+        if self.interval:
+            fire = self.anchor + (math.floor((after - self.anchor) / self.interval) + 1) * self.interval
+            while True:
+                yield fire
+                fire += self.interval
+        local = datetime.fromtimestamp(after, self.tz)
+        first = max(bisect_right(self.times, local.hour * 60 + local.minute) - 1, 0)
+        previous = after
+        #(ordinal of a day, time.time() of its midnight), reused by the following day
+        known = (None, None)
+        for ordinal in range(local.toordinal(), local.toordinal() + MAX_SEARCH_DAYS):
+            day = date.fromordinal(ordinal)
+            if self._matches(day):
+                midnight = known[1] if known[0] == ordinal else self._midnight(day)
+                known = (ordinal + 1, self._midnight(date.fromordinal(ordinal + 1)))
+                #on days the clocks don't change the fires are whole minutes after midnight
+                steady = known[1] - midnight == 86400
+                for minute in self.times[first:]:
+                    if steady:
+                        fire = midnight + minute * 60
+                    else:
+                        #a time skipped when the clocks go forward fires once the clocks have
+                        #changed, a time repeated when they go back only fires the first time
+                        fire = datetime(day.year, day.month, day.day, minute // 60, minute % 60,
+                                        tzinfo=self.tz).timestamp()
+                    if fire > previous:
+                        yield fire
+                        previous = fire
+            first = 0
+
+    def _midnight(self, day: date) -> float:
+        """
+        returns the start of a day in the timezone of the recurrence
+
+        Parameters:
+            day(date): the local date
+
+        Returns:
+            midnight(float): time.time() of 00:00 on that day
+        """
+        return datetime(day.year, day.month, day.day, tzinfo=self.tz).timestamp()
+
+def _cron_field(field: str, low: int, high: int, names: Dict[str, int]) -> Optional[frozenset]:
+    """
+    reads one field of a cron expression: *, numbers, names, ranges a-b, steps */n or a-b/n,
+    separated by commas
+
+    Parameters:
+        field(str): the field
+        low(int): smallest value of the field
+        high(int): largest value of the field
+        names(dict): lower case name -> value, i.e. "mon" -> 1 for the day of the week
+
+    Returns:
+        values(frozenset): the values of the field, None if the field is *
+
+    Raises:
+        ValueError: if the field is invalid
+    """
+    if field == "*":
+        return None
+    values = set()
+    for part in field.lower().split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if span == "*":
+            start, end = low, high
+        else:
+            start, _, end = span.partition("-")
+            start = names[start] if start in names else int(start)
+            end = (names[end] if end in names else int(end)) if end else (high if step > 1 else start)
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"{part} is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+@lru_cache(maxsize=4096)
+def parse_recurrence(rule: str, update_time: str = "00:00", timezone: str = "UTC") -> Recurrence:
+    """
+    reads the repeat rule of an update. Rules (not case sensitive):
+        "daily": every day at update_time
+        "weekdays", "weekends" or days such as "mon,wed,fri" or "monday,friday": at update_time
+            on those days
+        "every N minutes" or "every N hours" (also "every 15m", "every 2h"): counted from
+            update_time, in local time if N divides a day, otherwise in fixed steps from
+            update_time on INTERVAL_EPOCH in the timezone
+        a cron expression "minute hour day-of-month month day-of-week", i.e. "*/5 * * * *",
+            "30 8 * * mon-fri", day-of-week 0 or 7 is sunday
+    Identical rules return the same Recurrence, so their fire times are only computed once
+
+    Parameters:
+        rule(str): the repeat rule
+        update_time(str): time of day the update runs at, HH:MM 24 hour clock
+        timezone(str): IANA name of the timezone of the rule, i.e. "Europe/London"
+
+    Returns:
+        recurrence(Recurrence): when the update runs
+
+    Raises:
+        ValueError: if the rule, the time or the timezone is invalid, or the rule never fires
+    """
+    text = " ".join(rule.lower().split())
+    hours, _, minutes = update_time.partition(":")
+    if not (hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60):
+        raise ValueError(f"{update_time} is not a time formatted as HH:MM")
+    start = int(hours) * 60 + int(minutes)
+
+    every = _EVERY.match(text)
+    if every:
+        step = int(every.group(1)) * (60 if every.group(2).startswith("h") else 1)
+        if step < 1:
+            raise ValueError("the interval of a rule must be at least a minute")
+        if MINUTES_PER_DAY % step == 0:
+            recurrence = Recurrence(tuple(range(start % step, MINUTES_PER_DAY, step)), timezone=timezone)
+        else:
+            #counted from update_time on a fixed date in the timezone, not from midnight UTC
+            anchor = datetime(INTERVAL_EPOCH.year, INTERVAL_EPOCH.month, INTERVAL_EPOCH.day,
+                              start // 60, start % 60, tzinfo=get_timezone(timezone))
+            recurrence = Recurrence(timezone=timezone, interval=step * 60.0, anchor=anchor.timestamp())
+    elif text == "daily":
+        recurrence = Recurrence((start,), timezone=timezone)
+    elif text == "weekdays":
+        recurrence = Recurrence((start,), weekdays=frozenset(range(5)), timezone=timezone)
+    elif text == "weekends":
+        recurrence = Recurrence((start,), weekdays=frozenset((5, 6)), timezone=timezone)
+    elif text and all(day.strip() in _DAY_LIST_NAMES for day in text.split(",")):
+        recurrence = Recurrence((start,), timezone=timezone,
+                                weekdays=frozenset(_DAY_LIST_NAMES[day.strip()] for day in text.split(",")))
+    elif len(text.split()) == 5:
+        minute, hour, days, months, weekdays = text.split()
+        #cron counts the days of the week from sunday (0 or 7), python from monday (0)
+        cron_days = dict(zip("sun mon tue wed thu fri sat".split(), range(7)))
+        try:
+            minute_values = _cron_field(minute, 0, 59, {}) or frozenset(range(60))
+            hour_values = _cron_field(hour, 0, 23, {}) or frozenset(range(24))
+            day_values = _cron_field(days, 1, 31, {})
+            month_values = _cron_field(months, 1, 12, _MONTH_NAMES)
+            weekday_values = _cron_field(weekdays, 0, 7, cron_days)
+        except (KeyError, ValueError) as error:
+            raise ValueError(f"invalid cron expression {rule}: {error}") from None
+        if weekday_values is not None:
+            weekday_values = frozenset((value - 1) % 7 for value in weekday_values)
+        recurrence = Recurrence(tuple(sorted(hour * 60 + minute for hour in hour_values
+                                             for minute in minute_values)),
+                                month_values, day_values, weekday_values, timezone)
+    else:
+        raise ValueError(f"unknown repeat rule {rule}")
+    #checks the rule fires at all & precomputes its first fire times
+    recurrence.next_fire()
+    return recurrence
+
+def describe_recurrence(rule: str, update_time: str) -> str:
+    """
+    describes when a repeating update runs, for the dashboard
+
+    Parameters:
+        rule(str): the repeat rule, see parse_recurrence()
+        update_time(str): time of day the update runs at, HH:MM 24 hour clock
+
+    Returns:
+        description(str): i.e. "weekdays at 08:00", "every 15 minutes" or "at */5 * * * *"
+    """
+    text = " ".join(rule.split())
+    if _EVERY.match(text.lower()):
+        return f"{text} from {update_time}"
+    if len(text.split()) == 5:
+        return f"at {text}"
+    return f"{text} at {update_time}"
+
+def next_fire_times(recurrences: Iterable[Recurrence], after: Optional[float] = None,
+                    count: int = 1) -> List[List[float]]:
+    """
+    returns the next fire times of many recurrences in one call. Recurrences which are equal
+    (i.e. every update repeating daily at 08:00) are only computed once
+
+    Parameters:
+        recurrences(iterable): the recurrences, i.e. of every scheduled update
+        after(float): time.time() to start from, defaults to now
+        count(int): number of fire times per recurrence
+
+    Returns:
+        fires(list): the next count fire times of each recurrence, in the order given
+    """
+    after = time.time() if after is None else after
+    computed = {}
+    fires = []
+    for recurrence in recurrences:
+        result = computed.get(recurrence)
+        if result is None:
+            result = computed[recurrence] = recurrence.next_fires(after, count)
+        fires.append(result)
+    return fires
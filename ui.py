@@ -1,23 +1,391 @@
 """Main program oversees creating a webpage & updating it"""
 
+import cProfile
+import gzip
+import hashlib
+import io
 import json
-import sched
-import time
 import os
-from typing import Dict, Callable
-from flask import Flask, render_template, request
-from covid_news_handling import news_API_request
-from covid_data_handler import covid_API_request
-from time_handling import update_interval_func, current_time_func
+import pstats
+import queue
+import signal
+import socket
+import threading
+import time
+import traceback
+from types import MappingProxyType
+from typing import Any, Dict, Callable, List, Mapping, NamedTuple, Optional, Tuple, Union
+from flask import Flask, Response, g, jsonify, render_template, request, url_for
+from werkzeug.serving import make_server
+from covid_news_handling import news_API_request, NEWS_ERROR_TITLE
+from covid_data_handler import covid_API_batch_request, covid_stored_data, VALID_LOCATION_TYPES
+from time_handling import update_interval_func, current_time_func, get_timezone, parse_recurrence
+from cache_handling import RESPONSE_CACHE, ResponseCache, configure_cache
+from config_handling import CONFIG
+from news_store_handling import NewsStore
+from scheduler_handling import LabelScheduler, UpdateJob
+from series_handling import SERIES_STORE, query_series
+from metrics_handling import METRICS
+from upstream_handling import BUDGETS, FLIGHTS, configure_budgets
+from shared_state_handling import LEASE_SECONDS, SharedState
+from event_stream_handling import EventHub, format_event
+from search_handling import SearchIndex
 
 #initializing app from flask library
 app = Flask(__name__)
-#initializing scheduler object from sched library
-s = sched.scheduler(time.time, time.sleep)
+#initializing scheduler object, indexed by the label of each update
+SCHEDULER = LabelScheduler()
+#set to stop the scheduler thread, i.e. when a worker stops being the leader
+SCHEDULER_STOP = threading.Event()
+#guards NEWS_STORE, SCHEDULED_UPDATES, the covid data & the config file, which are
+#shared between request handlers and the scheduler thread
+STATE_LOCK = threading.RLock()
+
+class DashboardState(NamedTuple):
+    """
+    immutable snapshot of everything shown on the dashboard. A new snapshot is built in full
+    by publish_state() and swapped in, so request handlers read STATE without taking a lock
+
+    Attributes:
+        version(int): incremented every time a new snapshot is published
+        covid_data(mapping): (areaType, areaName) -> covid data of every tracked area,
+                             see covid_API_request
+        area_index(mapping): lower case areaName, or (areaType, areaName) in lower case,
+                             -> (areaType, areaName) of the tracked area
+        local_area(tuple): (areaType, areaName) shown as the local area by default
+        national_area(tuple): (areaType, areaName) shown as the nation
+        news(tuple): articles as read-only {"title": ..., "content": ...} mappings
+        updates(tuple): scheduled updates as read-only {"title": ..., "content": ...} mappings
+    """
+    version: int
+    covid_data: Mapping[Tuple[str, str], Mapping[str, int]]
+    area_index: Mapping[Any, Tuple[str, str]]
+    local_area: Tuple[str, str]
+    national_area: Tuple[str, str]
+    news: Tuple[Mapping[str, str], ...]
+    updates: Tuple[Mapping[str, str], ...]
+
+    def find_area(self, area_name: str, area_type: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        looks up a tracked area by name, ignoring case
+
+        parameters:
+            area_name(str): name of the area
+            area_type(str): type of the area, only needed if areas of different types share a name
+
+        returns:
+            area(tuple): (areaType, areaName) of the tracked area, None if it is not tracked
+        """
+        if area_type:
+            return self.area_index.get((area_type.lower(), area_name.lower()))
+        return self.area_index.get(area_name.lower())
+
+    def covid(self, area: Tuple[str, str]) -> Mapping[str, int]:
+        """
+        returns the covid data of a tracked area
+
+        parameters:
+            area(tuple): (areaType, areaName)
+
+        returns:
+            covid_data(mapping): the figures, placeholders if no data has been loaded yet
+        """
+        return self.covid_data.get(area, EMPTY_COVID_DATA)
+
+#placeholder figures shown until covid data has been requested
+EMPTY_COVID_DATA = MappingProxyType({"last7days_cases": 0, "hospital_cases": 0, "deaths": 0})
+
+#areas tracked by default, startup() replaces them with "Tracked_areas" from the config file
+LOCAL_AREA = ("ltla", "Exeter")
+NATIONAL_AREA = ("nation", "England")
+TRACKED_AREAS = [LOCAL_AREA, NATIONAL_AREA]
+
+def _area_index(areas: List[Tuple[str, str]]) -> Mapping[Any, Tuple[str, str]]:
+    """
+    builds the index used by DashboardState.find_area()
+
+    parameters:
+        areas(list): (areaType, areaName) of every tracked area
+
+    returns:
+        area_index(mapping): see DashboardState
+    """
+    area_index = {}
+    for area_type, area_name in areas:
+        area_index.setdefault(area_name.lower(), (area_type, area_name))
+        area_index[(area_type.lower(), area_name.lower())] = (area_type, area_name)
+    return MappingProxyType(area_index)
+
+STATE = DashboardState(0, MappingProxyType({}), _area_index(TRACKED_AREAS),
+                       LOCAL_AREA, NATIONAL_AREA, (), ())
+
+#dashboard data, only changed while holding STATE_LOCK & published through publish_state()
+#startup() replaces these defaults with the contents of the config file
+#(areaType, areaName) -> covid data, replaced as a whole by every covid update
+COVID_DATA = MappingProxyType({})
+AREA_INDEX = STATE.area_index
+NEWS_STORE = NewsStore()
+#label -> UpdateJob of every scheduled update
+SCHEDULED_UPDATES = {}
+CACHE_UPDATES = False
+CACHE_NEWS = False
+#set from "Profiling" in the config file, allows profiling a request with ?profile=1
+PROFILING = False
+#timezone the times of scheduled updates are in, set from "Timezone" in the config file
+TIMEZONE = "UTC"
+
+#database shared by the worker processes, None unless several workers are run by run_workers()
+SHARED = None
+#set while this process is the leader, which runs the scheduler & requests data from the APIs,
+#only used when several workers are run
+IS_LEADER = threading.Event()
+#seconds between checks for a new snapshot (followers) & for queued changes (leader)
+SYNC_INTERVAL = 0.5
+#version of the snapshot last read by a follower & time.monotonic() of the last check
+SNAPSHOT_VERSION = 0
+LAST_SYNC = 0.0
+
+#pushes every new DashboardState to the browsers connected to /stream, as a diff of the previous one
+EVENTS = EventHub()
+#seconds between keep-alive comments sent to an idle /stream, so proxies don't close it
+STREAM_HEARTBEAT = 15.0
+#full-text index of the articles in STATE.news, kept up to date by _swap_state()
+NEWS_INDEX = SearchIndex()
+
+def _entries(data: Dict[str, str]) -> Tuple[Mapping[str, str], ...]:
+    """
+    converts a title:content dictionary into a tuple of read-only dictionaries for the template
+
+    parameters:
+        data(dict): dictionary (or NewsStore) in title:content format
+
+    returns:
+        entries(tuple): {"title": ..., "content": ...} mappings in the order of data
+    """
+    return tuple(MappingProxyType({"title": key, "content": value}) for key, value in data.items())
+
+def publish_state() -> None:
+    """
+    builds a new DashboardState from the global dictionaries & swaps it in.
+    Must be called while holding STATE_LOCK, after the globals have been changed
+
+    parameters:
+        None
+
+    returns:
+        None
+    """
+    state = DashboardState(STATE.version + 1,
+                           COVID_DATA,
+                           AREA_INDEX,
+                           LOCAL_AREA,
+                           NATIONAL_AREA,
+                           _entries(NEWS_STORE),
+                           _entries({label: job.describe()
+                                     for label, job in SCHEDULED_UPDATES.items()}))
+    #keep the current snapshot (& its version) if nothing visible changed,
+    #so the rendered page stays cached
+    if state[1:] != STATE[1:]:
+        _swap_state(state)
+        #the leader shares every new snapshot with the other worker processes
+        if SHARED is not None and IS_LEADER.is_set():
+            SHARED.write_snapshot(_snapshot_json(state))
+
+def _swap_state(state: DashboardState) -> None:
+    """
+    replaces STATE, pushes what changed to the browsers connected to /stream & applies the
+    added & removed articles to NEWS_INDEX. Must be called while holding STATE_LOCK
+
+    parameters:
+        state(DashboardState): the new snapshot
+
+    returns:
+        None
+    """
+    global STATE
+    diff = _state_diff(STATE, state)
+    for title in diff.get("news_removed", ()):
+        NEWS_INDEX.remove(title)
+    for title, content in diff.get("news", ()):
+        NEWS_INDEX.add(title, content)
+    STATE = state
+    EVENTS.publish(state.version, format_event(_event_id(state.version), "diff", diff))
+
+def _event_id(version: int) -> str:
+    """
+    returns the id of the /stream event leading to a version of STATE. Versions are counted by
+    each worker process, so the id includes the process id: a browser which reconnects to
+    another worker is sent the full state
+
+    parameters:
+        version(int): version of the DashboardState
+
+    returns:
+        event_id(str): "<process id>-<version>"
+    """
+    return f"{os.getpid()}-{version}"
+
+def _state_diff(previous: DashboardState, state: DashboardState) -> Dict[str, Any]:
+    """
+    lists what changed between two snapshots, only the changed parts are sent to the browsers
+
+    parameters:
+        previous(DashboardState): the snapshot the browsers show
+        state(DashboardState): the new snapshot
+
+    returns:
+        diff(dict): {"version": ..., "covid": [[areaType, areaName, figures], ...],
+                     "news": [[title, content], ...], "news_removed": [title, ...],
+                     "updates": [[title, content], ...], "updates_removed": [title, ...]},
+                     keys without changes are left out, added entries replace entries with the
+                     same title
+    """
+    diff = {"version": state.version}
+    covid = [[area[0], area[1], dict(data)] for area, data in state.covid_data.items()
+             if previous.covid_data.get(area) != data]
+    if covid:
+        diff["covid"] = covid
+    for name in ("news", "updates"):
+        before = {entry["title"]: entry["content"] for entry in getattr(previous, name)}
+        after = {entry["title"]: entry["content"] for entry in getattr(state, name)}
+        #a new article may have no content (the newsapi often returns null), so it is
+        #looked for by title rather than compared with before.get(title), which is None too
+        added = [[title, content] for title, content in after.items()
+                 if title not in before or before[title] != content]
+        removed = [title for title in before if title not in after]
+        if added:
+            diff[name] = added
+        if removed:
+            diff[f"{name}_removed"] = removed
+    return diff
+
+def _snapshot_json(state: DashboardState) -> Dict[str, Any]:
+    """
+    converts the parts of a DashboardState that change while running into json for SHARED,
+    the areas come from the config file which every worker reads itself
+
+    parameters:
+        state(DashboardState): the snapshot to convert
+
+    returns:
+        data(dict): {"covid": [[areaType, areaName, figures], ...],
+                     "news": [[title, content], ...], "updates": [[title, content], ...]}
+    """
+    return {"covid": [[area[0], area[1], dict(data)] for area, data in state.covid_data.items()],
+            "news": [[entry["title"], entry["content"]] for entry in state.news],
+            "updates": [[entry["title"], entry["content"]] for entry in state.updates]}
+
+def sync_state() -> None:
+    """
+    replaces STATE with the snapshot written by the leader if it has changed, checked at most
+    every SYNC_INTERVAL seconds. Called before each request on the followers, so they serve
+    from memory & only read one row of SHARED per interval
+
+    parameters:
+        None
+
+    returns:
+        None
+    """
+    global COVID_DATA, SNAPSHOT_VERSION, LAST_SYNC
+    if time.monotonic() - LAST_SYNC < SYNC_INTERVAL:
+        return
+    with STATE_LOCK:
+        if time.monotonic() - LAST_SYNC < SYNC_INTERVAL or IS_LEADER.is_set():
+            return
+        LAST_SYNC = time.monotonic()
+        if SHARED.snapshot_version() == SNAPSHOT_VERSION:
+            return
+        SNAPSHOT_VERSION, data = SHARED.read_snapshot()
+        covid_data = {(area_type, area_name): MappingProxyType(figures)
+                      for area_type, area_name, figures in data["covid"]}
+        #the leader has stored new series in the covid store for the areas whose figures
+        #changed, only those are reloaded for /api/series
+        changed = [area for area, figures in covid_data.items() if COVID_DATA.get(area) != figures]
+        for area in changed:
+            covid_stored_data(area[1], area[0])
+        if changed or len(covid_data) != len(COVID_DATA):
+            COVID_DATA = MappingProxyType(covid_data)
+        _swap_state(DashboardState(STATE.version + 1, COVID_DATA, AREA_INDEX, LOCAL_AREA,
+                                   NATIONAL_AREA, _entries(dict(data["news"])),
+                                   _entries(dict(data["updates"]))))
+
+class RenderedPage(NamedTuple):
+    """
+    the index page rendered for one DashboardState & local area, or a /api/series response
+
+    Attributes:
+        version(int): version of the DashboardState (or Series) the page was rendered from
+        etag(str): quoted entity tag identifying the page, used for conditional GETs.
+                   The gzipped page is tagged with "-gz" appended, see _send_page()
+        html(bytes): the rendered page
+        gzipped(bytes): the rendered page compressed with gzip
+    """
+    version: int
+    etag: str
+    html: bytes
+    gzipped: bytes
+
+#(version, local area -> page) rendered from the most recent DashboardState,
+#replaced once STATE changes
+RENDERED_PAGES = (0, {})
+
+def render_index(state: DashboardState, local_area: Tuple[str, str]) -> RenderedPage:
+    """
+    returns the index page for a DashboardState & local area, only rendering the template
+    if this area's cached page was rendered from an older state
+
+    parameters:
+        state(DashboardState): the snapshot to render
+        local_area(tuple): (areaType, areaName) of the area shown as the local area
+
+    returns:
+        page(RenderedPage): the rendered page, plain & compressed
+    """
+    global RENDERED_PAGES
+    version, pages = RENDERED_PAGES
+    if version != state.version:
+        pages = {}
+        RENDERED_PAGES = (state.version, pages)
+    page = pages.get(local_area)
+    if page is not None:
+        return page
+
+    local_covid = state.covid(local_area)
+    national_covid = state.covid(state.national_area)
+    if local_area == state.local_area:
+        page_url = url_for("index")
+    else:
+        page_url = url_for("index", area_type=local_area[0], area_name=local_area[1])
+    #returns values to assignable objects in html code in templates/index
+    with METRICS.timer("index_render_seconds"):
+        html = render_template('index.html',
+                               title='Daily update',
+                               page_url=page_url,
+                               stream_url=url_for("stream"),
+                               version=_event_id(state.version),
+                               updates=state.updates,
+                               news_articles=state.news,
+                               location=local_area[1],
+                               location_type=local_area[0],
+                               nation_location=state.national_area[1],
+                               nation_location_type=state.national_area[0],
+                               local_7day_infections=local_covid["last7days_cases"],
+                               national_7day_infections=national_covid["last7days_cases"],
+                               hospital_cases=national_covid["hospital_cases"],
+                               deaths_total=national_covid["deaths"],
+                               image="Shrek-swamp-1.jpg",
+                               favicon="static/images/onion.ico").encode("utf-8")
+    etag = '"{}"'.format(hashlib.blake2b(html, digest_size=16).hexdigest())
+    page = RenderedPage(state.version, etag, html, gzip.compress(html))
+    #two requests may render the same page at once, either result is correct
+    pages[local_area] = page
+    return page
 
 def update_config(data:Dict) -> None:
     """
-    Rewrites given data to the config file
+    Replaces the config with the given data, the config file itself is written
+    in the background by CONFIG (see config_handling)
 
     Parameters:
         data: Dictionary formatted as a .json file. This dictionary will
@@ -26,8 +394,47 @@ def update_config(data:Dict) -> None:
     Returns:
         None
     """
-    with open("config.json", "w", encoding="utf-8") as json_file:
-        json.dump(data, json_file)
+    CONFIG.replace(data)
+
+def _save_scheduled_updates() -> None:
+    """
+    copies the next run of every scheduled update from SCHEDULER & updates the scheduled
+    updates in the config file if caching is enabled. Must be called holding STATE_LOCK
+
+    parameters:
+        None
+
+    returns:
+        None
+    """
+    for label, job in SCHEDULED_UPDATES.items():
+        scheduled = SCHEDULER.get(label)
+        if scheduled is not None:
+            SCHEDULED_UPDATES[label] = job._replace(next_run=scheduled.run_at)
+    if CACHE_UPDATES:
+        CONFIG.set("Scheduled_updates", {label: job.to_json()
+                                         for label, job in SCHEDULED_UPDATES.items()})
+
+def _finish_update(repeat: bool, label: str) -> None:
+    """
+    called by an update once it ran. Repeating updates are scheduled again by SCHEDULER,
+    so only their next run is saved, a single update is removed from the scheduled updates.
+    Must be called holding STATE_LOCK
+
+    parameters:
+        repeat(bool): whether the update repeats
+        label(str): name of the update, None if the update was not scheduled
+
+    returns:
+        None
+    """
+    if not isinstance(label, str) or label not in SCHEDULED_UPDATES:
+        return
+    #a single update leaves SCHEDULER before it runs, so its label may have been given to a new
+    #update meanwhile. The entry then belongs to the new update, which is still in SCHEDULER
+    if not repeat and label not in SCHEDULER:
+        del SCHEDULED_UPDATES[label]
+    _save_scheduled_updates()
 
 def update_news(repeat: bool, label: str):
     """
@@ -42,36 +449,22 @@ def update_news(repeat: bool, label: str):
     returns:
         None
     """
-    #request news from news_api_request
+    #request news from news_api_request, outside the lock so pages are served meanwhile
     new_news = news_API_request()
-    #add news to master dict if it has not previously been removed
-    for title, article in new_news.items():
-        if title not in DELETED_NEWS:
-            NEWS[title] = article
-
-    #update news dictionary in config file if caching is enabled
-    if CACHE_NEWS:
-        with open("config.json", "r", encoding="utf-8") as json_file:
-            config = json.load(json_file)
-            config["News_articles"] = NEWS
-        update_config(config)
-
-    #schedule new update if repeat is true,
-    #86400 -> number of seconds in a day, make update happen a day from now
-    #1, priority of update, default as 1
-    #update_news function to be ran once timer passes
-    #(Repeat, Label) arguments to pass to the function
-    if repeat:
-        s.enter(86400, 1, update_news, (repeat, label))
-    elif isinstance(label, str):
-        #update config scheduled updates dictionary to remove the update (it ran)
-        if CACHE_UPDATES:
-            with open("config.json", "r", encoding="utf-8") as json_file:
-                config_file = json.load(json_file)
-                del config_file["Scheduled_updates"][label]
-            update_config(config_file)
+    #a term whose request failed only returns the error article
+    fetched = not new_news or any(title != NEWS_ERROR_TITLE for title in new_news)
+    with STATE_LOCK:
+        #add news to the store, it skips articles which have previously been removed
+        NEWS_STORE.add_many(new_news)
 
-        del SCHEDULED_UPDATES[label]
+        #update news in config file if caching is enabled
+        if CACHE_NEWS:
+            CONFIG.set("News_store", NEWS_STORE.to_json())
+
+        _finish_update(repeat, label)
+        publish_state()
+    if fetched:
+        READY["news"].set()
 
 def remove_news_article(title:str) -> None:
     """
@@ -84,22 +477,19 @@ def remove_news_article(title:str) -> None:
         None
     """
 
-    #delete title from global list, add it to deleted news so it doesn't get re-added
-    DELETED_NEWS.append(title)
-    del NEWS[title]
+    with STATE_LOCK:
+        #delete article from the store, which remembers it so it doesn't get re-added
+        NEWS_STORE.remove(title)
 
-    #update config news dictionaries to be up to date
-    if CACHE_NEWS:
-        with open("config.json", "r", encoding="utf-8") as json_file:
-            config = json.load(json_file)
-            config["News_articles"] = NEWS
-            config["Deleted_news_articles"] = DELETED_NEWS
-        update_config(config)
+        #update config news to be up to date
+        if CACHE_NEWS:
+            CONFIG.set("News_store", NEWS_STORE.to_json())
+        publish_state()
 
 
 def update_covid_data(repeat: bool, label: str) -> None:
     """
-    calls for covid_API_request to update covid data
+    calls for covid_API_batch_request to update covid data of every tracked area
 
     parameters:
         Repeat(bool): whether the update should repeat once ran
@@ -108,54 +498,107 @@ def update_covid_data(repeat: bool, label: str) -> None:
     returns:
         None
     """
-    LOCAL_COVID_API = covid_API_request("Exeter", "ltla")
-    NATIONAL_COVID_API = covid_API_request("England", "nation")
+    global COVID_DATA
 
-    #schedule new update if repeat, parameters explained in update_news()
-    if repeat:
-        s.enter(86400, 1, update_covid_data, (repeat, label))
-    #deletes update from master dictionary(it ran)
-    else:
-        #updates SCHEDULED_UPDATES dictionary in config file
-        if CACHE_UPDATES:
-            with open("config.json", "r", encoding="utf-8") as json_file:
-                config_file = json.load(json_file)
-                del config_file["Scheduled_updates"][label]
-            update_config(config_file)
-        del SCHEDULED_UPDATES[label]
+    #every tracked area is requested in one batch
+    covid_data = covid_API_batch_request(TRACKED_AREAS, incremental=True)
+    #the request of every area failed if none of them has figures
+    fetched = any(data is not None for data in covid_data.values())
+    with STATE_LOCK:
+        #areas whose request failed keep their previous figures
+        merged = dict(COVID_DATA)
+        merged.update({area: MappingProxyType(data) for area, data in covid_data.items()
+                       if data is not None})
+        COVID_DATA = MappingProxyType(merged)
+
+        _finish_update(repeat, label)
+        publish_state()
+    if fetched:
+        READY["covid_data"].set()
 
 
-def schedule_update(label:str, update_time:str, update_func: Callable[bool, str], repeat: bool = False) -> None:
+def schedule_update(label:str, update_time:str, update_func: Callable[bool, str],
+                    repeat: Union[bool, str] = False) -> None:
     """
-    uses the sched library to add a scheduled update, triggered by the website
+    adds a scheduled update to SCHEDULER, triggered by the website
 
     Parameters:
         Label(str): Name of the update to be scheduled
         update_time(str): Time at which the update should run, 24h clock format
         update_func(function): function to be triggered by the update
-        repeat(bool): boolean representing whether the update should repeat once it runs
+        repeat: True to repeat the update daily, or the rule it repeats by (see
+                time_handling.parse_recurrence), False or "" if it only runs once
 
     returns:
         None
     """
-    #check if label already exists, if so add (number) to the end of it in order to make it unique
-    if label in SCHEDULED_UPDATES.keys():
-        label_temp = str(label)
-        count = 1
-        while True:
-            count += 1
-            label = f"{label_temp}({count})"
-            if label not in SCHEDULED_UPDATES.keys():
-                break
-    #update scheduled updates in config file
-    if CACHE_UPDATES:
-        with open("config.json", "r", encoding="utf-8") as json_file:
-            config = json.load(json_file)
-            config["Scheduled_updates"][label] = "{} to {} at {}".format((str(update_func).split(" "))[1],"repeat" if repeat else "occur", update_time)
-        update_config(config)
-    #add scheduled update to sched module /master scheduled updates list
-    SCHEDULED_UPDATES[label] = "{} to {} at {}".format((str(update_func).split(" "))[1],"repeat" if repeat else "occur", update_time)
-    s.enter(update_interval_func(update_time), 1, update_func, (repeat, label))
+    with STATE_LOCK:
+        #check if label already exists, if so add (number) to the end of it in order to make it unique
+        label = SCHEDULER.unique_label(str(label))
+        job = UpdateJob(update_func.__name__, update_time, "daily" if repeat is True else repeat or "", None)
+        #add scheduled update to scheduler /master scheduled updates list & config file
+        _schedule_jobs({label: (job, None)})
+        _save_scheduled_updates()
+        publish_state()
+
+def _schedule_jobs(jobs: Dict[str, Tuple[UpdateJob, Optional[float]]]) -> None:
+    """
+    adds several updates to SCHEDULER in one go & to the master scheduled updates list.
+    Must be called holding STATE_LOCK
+
+    parameters:
+        jobs(dict): label -> (update, seconds until its first run), None to run it at the next
+                    time given by its update time & repeat rule
+
+    returns:
+        None
+    """
+    entries = []
+    for label, (job, delay) in jobs.items():
+        if job.func_id not in UPDATE_FUNCS:
+            print(f"Error: unknown update function {job.func_id}, update {label} is dropped")
+            continue
+        try:
+            #repeating updates run again at the next time given by their rule, see time_handling
+            recurrence = job.recurrence(TIMEZONE)
+            if delay is None:
+                delay = update_interval_func(job.update_time, TIMEZONE) if recurrence is None \
+                        else recurrence.delay()
+        except ValueError as error:
+            print(f"Error: {error}, update {label} is dropped")
+            continue
+        entries.append((label, delay, UPDATE_FUNCS[job.func_id], (bool(job.repeat), label), recurrence))
+    for scheduled in SCHEDULER.enter_many(entries):
+        SCHEDULED_UPDATES[scheduled.label] = jobs[scheduled.label][0]._replace(next_run=scheduled.run_at)
+
+def load_scheduled_updates(stored: Dict[str, Any], missed_updates: str = "run") -> None:
+    """
+    re-schedules every update stored in the config file at once. Must be called holding STATE_LOCK
+
+    parameters:
+        stored(dict): label -> update, as stored by UpdateJob.to_json() or by earlier versions
+        missed_updates(str): what happens to updates whose run was missed while the dashboard
+                             was stopped, "run" runs them once straight away, "skip" drops single
+                             updates & moves repeating updates on to their next run
+
+    returns:
+        None
+    """
+    now = time.time()
+    jobs = {}
+    for label, data in stored.items():
+        job = UpdateJob.from_json(data)
+        if job.next_run is None:
+            delay = None
+        elif job.next_run > now or missed_updates == "run":
+            #a repeating update which is overdue runs once & then keeps to its rule
+            delay = job.next_run - now
+        elif job.repeat:
+            delay = None
+        else:
+            continue
+        jobs[label] = (job, delay)
+    _schedule_jobs(jobs)
 
 def cancel_scheduled_update(label:str) -> None:
     """
@@ -167,33 +610,87 @@ def cancel_scheduled_update(label:str) -> None:
     returns:
         None
     """
-    #iterate through scheduler object queue to find which update the label refers to
-    for event in s.queue:
-        if label == str(event[3][1]):
-            #deletes update from config file
-            if CACHE_UPDATES:
-                with open("config.json", "r", encoding="utf-8") as json_file:
-                    config_file = json.load(json_file)
-                    del config_file["Scheduled_updates"][label]
-                update_config(config_file)
+    with STATE_LOCK:
+        #the scheduler finds the update from its label without searching its queue
+        if SCHEDULER.cancel(label):
+            #deletes update & deletes it from config file
+            SCHEDULED_UPDATES.pop(label, None)
+            _save_scheduled_updates()
+            publish_state()
+
+#update functions which can be scheduled, by the name stored in the config file
+UPDATE_FUNCS = {"update_covid_data": update_covid_data, "update_news": update_news}
+
+def request_change(action: str, *args: Any) -> None:
+    """
+    applies a change made on the website. On a follower the change is queued in SHARED
+    and applied by the leader instead, it then shows once the next snapshot is read
 
-            #deletes/cancel update
-            del SCHEDULED_UPDATES[label]
-            s.cancel(event)
-            break
+    parameters:
+        action(str): "remove_news_article", "cancel_scheduled_update" or "schedule_update"
+        args: json serialisable arguments of the change, schedule_update takes the name of
+              the update function instead of the function
+
+    returns:
+        None
+    """
+    if SHARED is not None and not IS_LEADER.is_set():
+        SHARED.push_change(action, list(args))
+        return
+    if action == "schedule_update":
+        label, update_time, func_id, repeat = args
+        schedule_update(label, update_time, UPDATE_FUNCS[func_id], repeat)
+    elif action == "remove_news_article":
+        remove_news_article(*args)
+    elif action == "cancel_scheduled_update":
+        cancel_scheduled_update(*args)
+    else:
+        print(f"Error: unknown change {action}")
+
+def run_scheduler() -> None:
+    """
+    runs the scheduled updates as they become due, meant to be the target of a background
+    thread so updates fire on time and never inside a page request
+
+    parameters:
+        None
+
+    returns:
+        None
+    """
+    SCHEDULER.run_forever(SCHEDULER_STOP)
+
+def start_scheduler() -> threading.Thread:
+    """
+    starts the background thread running the scheduled updates
+
+    parameters:
+        None
+
+    returns:
+        thread(threading.Thread): the daemon thread running run_scheduler
+    """
+    SCHEDULER_STOP.clear()
+    thread = threading.Thread(target=run_scheduler, name="scheduler", daemon=True)
+    thread.start()
+    return thread
 
 #when the website is refreshed with /index at the end of the url, triggers this function
 @app.route('/index')
-def index():
+@app.route('/index/<area_type>/<area_name>')
+def index(area_type: Optional[str] = None, area_name: Optional[str] = None):
     """
     main function, calls upon Scheduled_updates if requested by website
-    and returns values to website
+    and returns values to website. The local area shown can be chosen with
+    /index/<area_type>/<area_name> or /index?area=<area_name>(&area_type=<area_type>)
 
     parameters:
-        none
+        area_type(str): type of the local area to show, from the url
+        area_name(str): name of the local area to show, from the url
 
     returns:
-        render_template(dict): parameters to be given to html code
+        response(Response): the rendered page, compressed if the browser accepts gzip,
+                            or 304 Not Modified if the browser's copy is current
     """
     #get parameters from url i.e. if url: /index?update=&two=hello&news=news
     #it will assign update_label as "hello" and check_update_news_articles as "news"
@@ -209,53 +706,373 @@ def index():
     check_update_covid_data = request.args.get("covid-data")
     check_update_news_articles = request.args.get("news")
 
-    #run any scheduled updates which are due
-    #keep at the front of the function, if this is triggered after adding new updates
-    #will cause problems in cases where no time has been specified and repeat is true
-    s.run(blocking=False)
-
+    #scheduled updates are run by the scheduler thread, see run_scheduler()
     #if certain param has been assigned something (not none)
     if remove_update:
-        cancel_scheduled_update(remove_update)
+        request_change("cancel_scheduled_update", remove_update)
     if remove_news:
-        remove_news_article(remove_news)
+        request_change("remove_news_article", remove_news)
     #assign current time if none has been assigned
     if not update_time:
-        update_time = current_time_func()
+        update_time = current_time_func(TIMEZONE)
     repeat = bool(repeat_update)
 
     #triggers update if update name has been given - then checks which update to trigger
     if update_label:
         if check_update_covid_data:
-            schedule_update(update_label, update_time, update_covid_data, repeat)
+            request_change("schedule_update", update_label, update_time, "update_covid_data", repeat)
         if check_update_news_articles:
-            schedule_update(update_label, update_time, update_news, repeat)
+            request_change("schedule_update", update_label, update_time, "update_news", repeat)
 
-    #converts scheduled updates & news dictionaries into lists of dictionaries
-    updates = []
-    for key, value in SCHEDULED_UPDATES.items():
-        updates.append({"title":key,"content":value})
-    news_list = []
-    for key, value in NEWS.items():
-        news_list.append({"title":key,"content":value})
+    #read the published snapshot once, it is never changed so no lock is needed
+    state = STATE
+    local_area = state.local_area
+    area_name = area_name or request.args.get("area")
+    if area_name:
+        local_area = state.find_area(area_name, area_type or request.args.get("area_type"))
+        if local_area is None:
+            return Response(f"{area_name} is not a tracked area", status=404, mimetype="text/plain")
+    return _send_page(render_index(state, local_area), "text/html")
 
-    #returns values to assignable objects in html code in templates/index
-    return render_template('index.html',
-                           title='Daily update',
-                           updates=updates,
-                           news_articles=news_list,
-                           location="Exeter",
-                           nation_location="England",
-                           local_7day_infections=LOCAL_COVID_API["last7days_cases"],
-                           national_7day_infections=NATIONAL_COVID_API["last7days_cases"],
-                           hospital_cases=NATIONAL_COVID_API["hospital_cases"],
-                           deaths_total=NATIONAL_COVID_API["deaths"],
-                           image="Shrek-swamp-1.jpg",
-                           favicon="static/images/onion.ico")
+def _send_page(page: RenderedPage, mimetype: str) -> Response:
+    """
+    answers the current request with a rendered page
+
+    parameters:
+        page(RenderedPage): the page to send
+        mimetype(str): type of the page
+
+    returns:
+        response(Response): the page, compressed if the browser accepts gzip,
+                            or 304 Not Modified if the browser's copy is current
+    """
+    #the gzipped page is a different sequence of bytes, so it has its own strong tag
+    gzipped = "gzip" in request.accept_encodings
+    tag = page.etag.strip('"')
+    #the browser already has this page, answer 304 Not Modified without a body
+    if request.if_none_match.contains(tag) or request.if_none_match.contains(f"{tag}-gz"):
+        response = Response(status=304)
+        sent = "not_modified"
+    elif gzipped:
+        response = Response(page.gzipped, mimetype=mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+        sent = "gzip"
+    else:
+        response = Response(page.html, mimetype=mimetype)
+        sent = "plain"
+    METRICS.inc("page_responses_total", labels={"endpoint": request.endpoint, "sent": sent})
+    response.headers["ETag"] = f'"{tag}-gz"' if gzipped else page.etag
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+#encoded /api/series responses, keyed by area, version of its series & query parameters,
+#so a query is only computed again once the series of the area has been replaced
+SERIES_RESPONSES = ResponseCache(ttl=3600, max_entries=256, max_bytes=16 * 1024 * 1024)
+
+@app.route('/api/series')
+@app.route('/api/series/<area_type>/<area_name>')
+def api_series(area_type: Optional[str] = None, area_name: Optional[str] = None):
+    """
+    returns the covid time series of a tracked area as json, from SERIES_STORE in memory.
+    The area is chosen like on /index, the local area is used if none is given.
+    Optional url parameters:
+        fields: comma separated series fields, see series_handling.SERIES_FIELDS
+        start, end: first & last day returned, YYYY-MM-DD
+        aggregate: daily, weekly or rolling (mean over window days)
+        window: number of days of the rolling mean, 7 by default
+        points: maximum number of values per field, values are averaged into buckets if there are more
+
+    parameters:
+        area_type(str): type of the area, from the url
+        area_name(str): name of the area, from the url
+
+    returns:
+        response(Response): {"areaType", "areaName", "aggregate", "dates", field: values...},
+                            400 for invalid parameters, 404 for an area without data
+    """
+    state = STATE
+    area = state.local_area
+    area_name = area_name or request.args.get("area")
+    if area_name:
+        area = state.find_area(area_name, area_type or request.args.get("area_type"))
+        if area is None:
+            return jsonify({"error": f"{area_name} is not a tracked area"}), 404
+    series = SERIES_STORE.get(area)
+    if series is None:
+        return jsonify({"error": f"no covid data has been loaded for {area[1]} yet"}), 404
+
+    fields = tuple(field for field in request.args.get("fields", "").split(",") if field)
+    start = request.args.get("start")
+    end = request.args.get("end")
+    aggregate = request.args.get("aggregate", "daily")
+    try:
+        window = int(request.args.get("window", 7))
+        points = request.args.get("points")
+        points = None if points is None else int(points)
+    except ValueError:
+        return jsonify({"error": "window and points must be whole numbers"}), 400
+
+    key = (area, series.version, fields, start, end, aggregate, window, points)
+    page = SERIES_RESPONSES.get(key)
+    if page is None:
+        try:
+            result = query_series(series, list(fields), start, end, aggregate, window, points)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+        body = json.dumps({"areaType": area[0], "areaName": area[1], "aggregate": aggregate,
+                           **result}, separators=(",", ":")).encode("utf-8")
+        etag = '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+        page = RenderedPage(series.version, etag, body, gzip.compress(body))
+        SERIES_RESPONSES.put(key, page, len(body) + len(page.gzipped))
+    return _send_page(page, "application/json")
+
+def _state_event(state: DashboardState) -> bytes:
+    """
+    encodes the full state as a /stream event, sent to a browser which connects or has
+    missed diffs
+
+    parameters:
+        state(DashboardState): the snapshot to send
+
+    returns:
+        payload(bytes): "state" event, see format_event()
+    """
+    return format_event(_event_id(state.version), "state",
+                        {"version": state.version, **_snapshot_json(state)})
+
+def _stream_version(event_id: Optional[str]) -> Optional[int]:
+    """
+    reads the version of STATE a browser shows from the id of the last event it received
+
+    parameters:
+        event_id(str): Last-Event-ID header, or the version written into the page
+
+    returns:
+        version(int): version of STATE, None if the id is missing or from another worker
+    """
+    pid, _, version = (event_id or "").partition("-")
+    if pid != str(os.getpid()) or not version.isdigit():
+        return None
+    return int(version)
+
+@app.route('/stream')
+def stream():
+    """
+    pushes changes of the dashboard to the browser as Server-Sent Events, instead of the browser
+    reloading the whole page. The browser is sent the diffs it missed since the version given by
+    its Last-Event-ID header (or ?version=, written into the page), or the full state if they
+    are no longer kept, then a "diff" event per new DashboardState, see _state_diff()
+
+    parameters:
+        none
+
+    returns:
+        response(Response): text/event-stream kept open until the browser disconnects
+    """
+    since = _stream_version(request.headers.get("Last-Event-ID") or request.args.get("version"))
+    #subscribe before reading STATE, so no diff published in between is missed
+    subscriber = EVENTS.subscribe()
+    follower = SHARED is not None
+
+    def events():
+        try:
+            state = STATE
+            missed = None if since is None else EVENTS.since(since)
+            if missed is None:
+                yield _state_event(state)
+                sent = state.version
+            else:
+                sent = since
+                for version, payload in missed:
+                    yield payload
+                    sent = version
+            idle = time.monotonic()
+            while True:
+                #followers only learn of a new snapshot by checking SHARED, see sync_state()
+                timeout = SYNC_INTERVAL if follower else STREAM_HEARTBEAT
+                try:
+                    version, payload = subscriber.events.get(timeout=timeout)
+                except queue.Empty:
+                    if subscriber.overflowed:
+                        #the browser fell behind, send the full state instead of the dropped diffs
+                        subscriber.overflowed = False
+                        state = STATE
+                        yield _state_event(state)
+                        sent = state.version
+                        idle = time.monotonic()
+                    elif follower and not IS_LEADER.is_set():
+                        sync_state()
+                    if time.monotonic() - idle >= STREAM_HEARTBEAT:
+                        yield b": keep-alive\n\n"
+                        idle = time.monotonic()
+                    continue
+                #diffs already included in the replay or the full state are skipped
+                if version > sent:
+                    yield payload
+                    sent = version
+                    idle = time.monotonic()
+        finally:
+            EVENTS.unsubscribe(subscriber)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    #stops proxies such as nginx from buffering the events
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/api/news/search')
+def api_news_search():
+    """
+    searches the titles & contents of the articles shown on the dashboard, from NEWS_INDEX
+    in memory. Url parameters:
+        q: words to search for, articles containing more of them rank first
+        limit: maximum number of articles returned, 10 by default & at most 100
+
+    parameters:
+        none
+
+    returns:
+        response(Response): {"query", "total", "results": [{"title", "content", "score"}, ...]},
+                            best match first, 400 for a missing query or invalid limit
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q must be given"}), 400
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "limit must be a whole number"}), 400
+    if not 1 <= limit <= 100:
+        return jsonify({"error": "limit must be between 1 and 100"}), 400
+    with METRICS.timer("news_search_seconds"):
+        total, results = NEWS_INDEX.search(query, limit)
+    return jsonify({"query": query, "total": total,
+                    "results": [{"title": title, "content": content, "score": round(score, 4)}
+                                for title, content, score in results]})
+
+@app.route('/api/state')
+def api_state():
+    """
+    returns everything shown on the dashboard as json, the same data as the "state" event of /stream
+
+    parameters:
+        none
+
+    returns:
+        response(Response): {"version", "covid", "news", "updates"}, see _snapshot_json()
+    """
+    state = STATE
+    return jsonify({"version": state.version, **_snapshot_json(state)})
+
+def _change_response() -> Tuple[Response, int]:
+    """
+    answers a json mutation once its change has been applied or queued
+
+    parameters:
+        none
+
+    returns:
+        response(Response): {"version": ...} of the new STATE, status 200, or {"queued": true}
+                            with status 202 on a follower, the change then shows on /stream
+                            once the leader has applied it
+    """
+    if SHARED is not None and not IS_LEADER.is_set():
+        return jsonify({"queued": True}), 202
+    return jsonify({"version": STATE.version}), 200
+
+def _json_title(name: str) -> Optional[str]:
+    """
+    reads a required string from the json body of the request
+
+    parameters:
+        name(str): key of the string
+
+    returns:
+        value(str): the string, None if it is missing, empty or not a string
+    """
+    data = request.get_json(silent=True)
+    value = data.get(name) if isinstance(data, dict) else None
+    return value if isinstance(value, str) and value else None
+
+@app.route('/api/news/dismiss', methods=["POST"])
+def api_dismiss_news():
+    """
+    removes a news article, json body {"title": ...}
+
+    parameters:
+        none
+
+    returns:
+        response(Response): see _change_response(), 400 if the title is missing
+    """
+    title = _json_title("title")
+    if title is None:
+        return jsonify({"error": "title must be given"}), 400
+    request_change("remove_news_article", title)
+    return _change_response()
+
+@app.route('/api/updates/cancel', methods=["POST"])
+def api_cancel_update():
+    """
+    cancels a scheduled update, json body {"label": ...}
+
+    parameters:
+        none
+
+    returns:
+        response(Response): see _change_response(), 400 if the label is missing
+    """
+    label = _json_title("label")
+    if label is None:
+        return jsonify({"error": "label must be given"}), 400
+    request_change("cancel_scheduled_update", label)
+    return _change_response()
+
+@app.route('/api/updates', methods=["POST"])
+def api_schedule_update():
+    """
+    schedules updates, json body {"label": ..., "time": "HH:MM", "covid_data": bool,
+    "news": bool, "repeat": bool or rule}. Like the form on /index, the time defaults to now and
+    an update is scheduled for covid data & for news if both are chosen. repeat is true to
+    repeat daily, or a rule such as "weekdays", "every 15 minutes" or a cron expression,
+    see time_handling.parse_recurrence
+
+    parameters:
+        none
+
+    returns:
+        response(Response): see _change_response(), 400 for invalid parameters
+    """
+    label = _json_title("label")
+    if label is None:
+        return jsonify({"error": "label must be given"}), 400
+    data = request.get_json()
+    update_time = data.get("time") or current_time_func(TIMEZONE)
+    hours, _, minutes = str(update_time).partition(":")
+    if not (hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60):
+        return jsonify({"error": "time must be formatted as HH:MM"}), 400
+    func_ids = [func_id for func_id, key in (("update_covid_data", "covid_data"), ("update_news", "news"))
+                if data.get(key)]
+    if not func_ids:
+        return jsonify({"error": "covid_data, news or both must be chosen"}), 400
+    repeat = data.get("repeat") or False
+    if isinstance(repeat, str):
+        try:
+            parse_recurrence(repeat, update_time, TIMEZONE)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+    else:
+        repeat = bool(repeat)
+    for func_id in func_ids:
+        request_change("schedule_update", label, update_time, func_id, repeat)
+    return _change_response()
 
 def startup() -> None:
     """
-    defines certain global variables from config file & updates scheduler/news from config file
+    defines certain global variables from config file & updates scheduler/news from config file.
+    Nothing is requested from the Cov19API or the newsapi, the dashboard starts with the data
+    stored by the last run (or placeholders), call warm_up() to request fresh data
 
     parameters:
         None
@@ -263,55 +1080,53 @@ def startup() -> None:
     returns:
         None
     """
-    global NEWS, DELETED_NEWS, LOCAL_COVID_API, NATIONAL_COVID_API
-    global CACHE_UPDATES, CACHE_NEWS, SCHEDULED_UPDATES
-
-    #get local & national covid data from covid_API_request()
-    LOCAL_COVID_API = covid_API_request()
-    NATIONAL_COVID_API = covid_API_request("england", "nation")
+    global NEWS_STORE, COVID_DATA, AREA_INDEX, TRACKED_AREAS, LOCAL_AREA, NATIONAL_AREA
+    global CACHE_UPDATES, CACHE_NEWS, SCHEDULED_UPDATES, PROFILING, TIMEZONE
 
     #updates parameters including news & scheduled updates from config file
-    if os.path.exists("config.json"):
-        with open("config.json", "r", encoding="utf-8") as json_config_file:
-            config_file = json.load(json_config_file)
-            
-            #updating scheduler
-            CACHE_UPDATES = False
+    if CONFIG.exists():
+        with STATE_LOCK:
+            config_file = CONFIG.load()
+            configure_cache(config_file.get("Response_cache", {}))
+            configure_budgets(config_file.get("Upstream_budgets", {}))
+            PROFILING = str(config_file.get("Profiling", "false")).lower() == "true"
+            TIMEZONE = config_file.get("Timezone", "UTC")
+            try:
+                get_timezone(TIMEZONE)
+            except ValueError as error:
+                print(f"Error: {error}, scheduled updates use UTC")
+                TIMEZONE = "UTC"
+
+            #updating tracked areas
+            LOCAL_AREA = tuple(config_file.get("Local_area", LOCAL_AREA))
+            NATIONAL_AREA = tuple(config_file.get("National_area", NATIONAL_AREA))
+            TRACKED_AREAS = _read_areas(config_file.get("Tracked_areas", []))
+
+            #updating scheduler, all stored updates are scheduled in one go. Jobs left from
+            #before are cancelled, they may have been cancelled since by another worker
+            SCHEDULER.cancel_all()
             SCHEDULED_UPDATES = {}
-            if config_file["Cache_updates"].lower() == "false":
-                config_file["Scheduled_updates"] = {}
+            CACHE_UPDATES = config_file["Cache_updates"].lower() != "false"
+            if CACHE_UPDATES:
+                load_scheduled_updates(config_file["Scheduled_updates"],
+                                       config_file.get("Missed_updates", "run"))
             else:
-                #iterates through SCHEDULED_UPDATES dictionary to re-schedule existing updates
-                for key, value in config_file["Scheduled_updates"].items():
-                    #key is the label
-                    #value is in format: "{function} to {repeat} at {time}"
-                    values = value.split(" ")
-                    if values[0] == "update_covid_data":
-                        func = update_covid_data
-                    else:
-                        func = update_news
-                    repeat = bool(values[2] == "repeat")
-                    
-                    schedule_update(key, values[4], func, repeat)
-                    #CACHE_UPDATES MUST BE AFTER SCHEDULE UPDATE
-                    #otherwise config file will be modified when schedule update is called..
-                    CACHE_UPDATES = True
-                    
+                config_file["Scheduled_updates"] = {}
+            _save_scheduled_updates()
+
             #updating news
+            NEWS_STORE = NewsStore(**config_file.get("News_store_limits", {}))
+            #articles & removed titles stored in full by earlier versions
+            legacy_news = config_file.pop("News_articles", {})
+            legacy_deleted = config_file.pop("Deleted_news_articles", [])
+            #fresh news is requested by warm_up() in both cases
             if config_file["Cache_news"].lower() == "false":
                 CACHE_NEWS = False
-                config_file["News_articles"] = []
-                config_file["Deleted_news_articles"] = []
-                DELETED_NEWS = []
-                NEWS = news_API_request()
+                config_file.pop("News_store", None)
             else:
                 CACHE_NEWS = True
-                NEWS = config_file["News_articles"]
-                DELETED_NEWS = config_file["Deleted_news_articles"]
-                #needs to have params for update_news
-                #False so not to repeat the update
-                #None so no update is deleted, as it doesn't exist
-                update_news(False, None)
+                NEWS_STORE.load_json(config_file.get("News_store", {}))
+                NEWS_STORE.load_legacy(legacy_news, legacy_deleted)
 
         #update config file & initialise website
         update_config(config_file)
@@ -319,6 +1134,342 @@ def startup() -> None:
     else:
         print("Error: No config file found")
 
-if __name__ == '__main__':
+    with STATE_LOCK:
+        #get covid data stored by the last covid update for every tracked area, if there is any
+        AREA_INDEX = _area_index(TRACKED_AREAS)
+        stored = {area: covid_stored_data(area[1], area[0]) for area in TRACKED_AREAS}
+        COVID_DATA = MappingProxyType({area: MappingProxyType(data)
+                                       for area, data in stored.items() if data is not None})
+        publish_state()
+
+def _read_areas(areas: List[List[str]]) -> List[Tuple[str, str]]:
+    """
+    reads the "Tracked_areas" config value, invalid areas are dropped, the local & national
+    areas are always tracked
+
+    parameters:
+        areas(list): [areaType, areaName] of every area to track
+
+    returns:
+        areas(list): (areaType, areaName) of every area to track, without duplicates
+    """
+    tracked = {LOCAL_AREA: None, NATIONAL_AREA: None}
+    for area in areas:
+        if len(area) != 2 or area[0] not in VALID_LOCATION_TYPES:
+            print(f"Error: {area} is not a valid area, valid location types are: {VALID_LOCATION_TYPES}")
+            continue
+        tracked[(area[0], area[1])] = None
+    return list(tracked)
+
+#set once fresh data has been loaded, by warm_up() or by a later update if the upstream was down
+READY = {"covid_data": threading.Event(), "news": threading.Event()}
+
+def _warm_up(name: str, update_func: Callable[[bool, str], None]) -> None:
+    """
+    runs an update once, the target of the warm up threads. The update marks its data as ready
+    if it loaded fresh data, otherwise the data is marked as ready by the next update which does
+
+    parameters:
+        name(str): key of the update in READY
+        update_func(function): update_covid_data or update_news
+
+    returns:
+        None
+    """
+    try:
+        #False so not to repeat the update
+        #None so no update is deleted, as it doesn't exist
+        update_func(False, None)
+    except Exception as error:
+        print(f"Error: warming up {name} failed: {error!r}")
+        return
+    if not READY[name].is_set():
+        print(f"Error: warming up {name} failed, no fresh data could be requested")
+
+def warm_up() -> Dict[str, threading.Thread]:
+    """
+    requests fresh covid data & news in background threads, so the website is served from the
+    data loaded by startup() meanwhile. /ready reports when the fresh data has been loaded
+
+    parameters:
+        None
+
+    returns:
+        threads(dict): name of the data -> thread requesting it
+    """
+    updates = {"covid_data": update_covid_data}
+    if CONFIG.exists():
+        updates["news"] = update_news
+    else:
+        #there are no newsapi parameters without a config file, no news will be loaded
+        READY["news"].set()
+    threads = {}
+    for name, update_func in updates.items():
+        threads[name] = threading.Thread(target=_warm_up, args=(name, update_func),
+                                         name=f"warm-up-{name}", daemon=True)
+        threads[name].start()
+    return threads
+
+@app.route('/ready')
+def ready():
+    """
+    readiness check, reports whether fresh covid data & news have been loaded since startup
+
+    parameters:
+        none
+
+    returns:
+        response(Response): json with a boolean per data & overall, status 503 until all are ready
+    """
+    status = {name: event.is_set() for name, event in READY.items()}
+    status["ready"] = all(status.values())
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics')
+def metrics():
+    """
+    returns the counters & timings recorded in METRICS in the Prometheus text format,
+    together with the current size of the caches, news store & scheduler and what is
+    left of the request budget of each upstream
+
+    parameters:
+        none
+
+    returns:
+        response(Response): the metrics as text/plain
+    """
+    for name, value in RESPONSE_CACHE.stats().items():
+        METRICS.set(f"response_cache_{name}", value)
+    METRICS.set("config_writes", CONFIG.writes)
+    METRICS.set("scheduled_updates", len(SCHEDULER))
+    METRICS.set("news_articles", len(STATE.news))
+    METRICS.set("news_index_terms", NEWS_INDEX.terms())
+    METRICS.set("series_areas", len(SERIES_STORE))
+    METRICS.set("state_version", STATE.version)
+    METRICS.set("upstream_requests_in_flight", FLIGHTS.in_flight())
+    METRICS.set("worker_is_leader", 1 if SHARED is None or IS_LEADER.is_set() else 0,
+                {"pid": os.getpid()})
+    for upstream, budget in BUDGETS.items():
+        for period, remaining in budget.remaining().items():
+            if remaining is not None:
+                METRICS.set("upstream_budget_remaining", remaining,
+                            {"upstream": upstream, "period": period})
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+@app.before_request
+def start_profiling() -> None:
+    """
+    starts profiling the request if profiling is enabled & the url contains profile=1,
+    otherwise only a flag & a dictionary lookup are added to each request
+
+    parameters:
+        none
+
+    returns:
+        None
+    """
+    if PROFILING and request.args.get("profile") == "1":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def stop_profiling(response: Response) -> Response:
+    """
+    replaces the response of a profiled request with the 40 functions it spent most time in
+
+    parameters:
+        response(Response): the response of the request
+
+    returns:
+        response(Response): the profile as text/plain, or the response if it was not profiled
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    stats_text = io.StringIO()
+    pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(40)
+    return Response(stats_text.getvalue(), mimetype="text/plain")
+
+@app.before_request
+def follow_leader() -> None:
+    """
+    on a follower worker, reads the leader's latest snapshot before serving the request
+
+    parameters:
+        none
+
+    returns:
+        None
+    """
+    if SHARED is not None and not IS_LEADER.is_set():
+        sync_state()
+
+def become_leader() -> None:
+    """
+    makes this worker the leader: the config is read again as the previous leader may have
+    changed it, then the scheduler, the warm up & the config writer are started
+
+    parameters:
+        None
+
+    returns:
+        None
+    """
+    CONFIG.reload()
+    startup()
+    IS_LEADER.set()
+    with STATE_LOCK:
+        SHARED.write_snapshot(_snapshot_json(STATE))
+    warm_up()
+    start_scheduler()
+    CONFIG.start(float(CONFIG.get("Config_flush_seconds", 5)))
+
+def stop_leading() -> None:
+    """
+    stops the scheduler & config writer of a worker which lost the leader lease, i.e. after
+    being paused for longer than LEASE_SECONDS while another worker took over
+
+    parameters:
+        None
+
+    returns:
+        None
+    """
+    IS_LEADER.clear()
+    SCHEDULER_STOP.set()
+    CONFIG.stop()
+
+def run_election(stop: threading.Event) -> None:
+    """
+    takes or renews the leader lease every third of LEASE_SECONDS. While leading, the changes
+    queued by the other workers are applied every SYNC_INTERVAL. The target of a thread in
+    every worker
+
+    parameters:
+        stop(threading.Event): set to stop the election
+
+    returns:
+        None
+    """
+    renewed = 0.0
+    while not stop.is_set():
+        try:
+            if time.monotonic() - renewed >= LEASE_SECONDS / 3:
+                leader = SHARED.try_lead()
+                renewed = time.monotonic() if leader else 0.0
+                if leader and not IS_LEADER.is_set():
+                    become_leader()
+                elif not leader and IS_LEADER.is_set():
+                    print("Error: another worker took over as leader, stopping the scheduler")
+                    stop_leading()
+            if IS_LEADER.is_set():
+                for action, args in SHARED.take_changes():
+                    request_change(action, *args)
+        except Exception as error:
+            print(f"Error: leader election failed: {error!r}")
+        stop.wait(SYNC_INTERVAL)
+
+def _run_worker(listener: socket.socket, host: str, port: int, state_file: str) -> None:
+    """
+    body of a worker process: serves the website from the shared listening socket, starting
+    as a follower until it wins the leader lease
+
+    parameters:
+        listener(socket.socket): socket bound by run_workers(), shared by every worker
+        host(str): host the socket is bound to
+        port(int): port the socket is bound to
+        state_file(str): path of the SQLite database shared by the workers
+
+    returns:
+        None
+    """
+    global SHARED
+    SHARED = SharedState(state_file)
     startup()
-    app.run()
+    stop = threading.Event()
+    threading.Thread(target=run_election, args=(stop,), name="leader-election", daemon=True).start()
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    #SIGTERM from run_workers() stops the worker the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if IS_LEADER.is_set():
+            stop_leading()
+            #hand over straight away instead of after LEASE_SECONDS
+            SHARED.resign()
+
+def run_workers(workers: int, host: str = "127.0.0.1", port: int = 5000,
+                state_file: str = "dashboard_state.db") -> None:
+    """
+    serves the website from several worker processes sharing one listening socket, so page
+    requests are spread over several cores. The workers share the dashboard through SQLite,
+    one of them is elected to run the scheduler & request data, see run_election().
+    Workers which exit are started again. Needs os.fork, so not available on Windows
+
+    parameters:
+        workers(int): number of worker processes
+        host(str): host to listen on
+        port(int): port to listen on
+        state_file(str): path of the SQLite database shared by the workers
+
+    returns:
+        None
+    """
+    listener = socket.create_server((host, port), backlog=128)
+    children = {}
+
+    def spawn(number: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            #the worker never returns into the loop of the parent process
+            status = 0
+            try:
+                _run_worker(listener, host, port, state_file)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            os._exit(status)
+        children[pid] = number
+
+    print(f" * Running on http://{host}:{port} with {workers} workers")
+    #SIGTERM stops the workers the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for number in range(workers):
+            spawn(number)
+        while True:
+            pid, _ = os.wait()
+            number = children.pop(pid, None)
+            if number is not None:
+                print(f"Error: worker {number} exited, starting it again")
+                spawn(number)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        listener.close()
+
+if __name__ == '__main__':
+    WORKERS = int(CONFIG.get("Workers", 1)) if CONFIG.exists() else 1
+    if WORKERS > 1 and hasattr(os, "fork"):
+        run_workers(WORKERS, state_file=CONFIG.get("Shared_state_file", "dashboard_state.db"))
+    else:
+        startup()
+        warm_up()
+        start_scheduler()
+        CONFIG.start(float(CONFIG.get("Config_flush_seconds", 5)))
+        app.run()
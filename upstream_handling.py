@@ -0,0 +1,247 @@
+"""This file deals with sharing & limiting requests to the Cov19API and the newsapi"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from metrics_handling import METRICS
+
+class UpstreamBudgetError(RuntimeError):
+    """raised when a request is needed but the budget of its upstream is used up"""
+
+class _Flight:
+    """
+    a request in progress, shared by every caller asking for the same key
+
+    Attributes:
+        done(threading.Event): set once the request has finished
+        result: value returned by the request
+        error(BaseException): exception raised by the request, None if it succeeded
+    """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    coalesces concurrent identical requests: the first caller for a key runs the request,
+    callers asking for the same key meanwhile wait for it and receive its result (or its
+    exception) instead of sending the same request again
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Tuple[Hashable, ...], func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """
+        runs func(*args, **kwargs) unless a request with the same key is in progress,
+        in which case its result is waited for & returned
+
+        Parameters:
+            key: identifies the request, starting with the name of the upstream,
+                 i.e. ("news", term, country, language)
+            func: function making the request
+            args, kwargs: arguments passed to func
+
+        Returns:
+            result: the value returned by func, possibly shared with other callers so it
+                    must not be changed
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.shared += 1
+        if not leader:
+            METRICS.inc("upstream_shared_requests_total", labels={"upstream": key[0]})
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self) -> int:
+        """
+        returns the number of requests in progress
+
+        Parameters:
+            None
+
+        Returns:
+            count(int): number of keys being requested
+        """
+        with self._lock:
+            return len(self._flights)
+
+class RateBudget:
+    """
+    thread safe request budget of one upstream: a token bucket refilled at per_minute
+    requests a minute (allowing bursts of up to per_minute requests), plus a quota of
+    per_day requests per UTC day. A limit of 0 means no limit. A request waits up to
+    max_wait seconds for the bucket to refill, but never for the next day's quota
+    """
+
+    def __init__(self, per_minute: float = 0, per_day: int = 0, max_wait: float = 0,
+                 timefunc: Callable[[], float] = time.time,
+                 sleepfunc: Callable[[float], None] = time.sleep):
+        """
+        Parameters:
+            per_minute: requests allowed per minute
+            per_day: requests allowed per UTC day
+            max_wait: seconds a request may wait for the per minute limit to allow it
+            timefunc: returns the current time, time.time unless the budget is tested
+            sleepfunc: waits for a number of seconds, time.sleep unless the budget is tested
+        """
+        self.timefunc = timefunc
+        self.sleepfunc = sleepfunc
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.max_wait = max_wait
+        self._tokens = float(per_minute)
+        self._refilled = timefunc()
+        self._day = int(self._refilled // 86400)
+        self._used_today = 0
+        self._lock = threading.Lock()
+
+    def configure(self, per_minute: float, per_day: int, max_wait: Optional[float] = None) -> None:
+        """
+        changes the limits, requests already made today still count towards the quota
+
+        Parameters:
+            per_minute: requests allowed per minute
+            per_day: requests allowed per UTC day
+            max_wait: seconds a request may wait for the per minute limit, None to keep it
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if max_wait is not None:
+                self.max_wait = max_wait
+            #a bucket which had no limit starts full, otherwise it keeps the tokens left
+            if self.per_minute:
+                self._tokens = min(self._tokens, float(per_minute))
+            else:
+                self._tokens = float(per_minute)
+            self.per_minute = per_minute
+            self.per_day = per_day
+
+    def try_acquire(self, timeout: float = 0) -> bool:
+        """
+        uses up one request of the budget, waiting up to timeout seconds for the per minute
+        limit to allow it. Returns straight away once the day's quota is used up, as waiting
+        for the next day would hold up the update far longer than serving cached data
+
+        Parameters:
+            timeout(float): seconds to wait at most, 0 to never wait
+
+        Returns:
+            acquired(bool): True if the request may be sent
+        """
+        deadline = self.timefunc() + timeout
+        while True:
+            with self._lock:
+                now = self.timefunc()
+                if int(now // 86400) != self._day:
+                    self._day = int(now // 86400)
+                    self._used_today = 0
+                if self.per_day and self._used_today >= self.per_day:
+                    return False
+                if self.per_minute:
+                    self._tokens = min(float(self.per_minute),
+                                       self._tokens + (now - self._refilled) * self.per_minute / 60)
+                    self._refilled = now
+                if not self.per_minute or self._tokens >= 1:
+                    if self.per_minute:
+                        self._tokens -= 1
+                    self._used_today += 1
+                    return True
+                #seconds until the bucket holds a whole token again
+                wait = (1 - self._tokens) * 60 / self.per_minute
+            #other threads may take the token first, the bucket is then checked again
+            if now + wait > deadline:
+                return False
+            self.sleepfunc(wait)
+
+    def remaining(self) -> Dict[str, Optional[float]]:
+        """
+        returns what is left of the budget, used by /metrics
+
+        Parameters:
+            None
+
+        Returns:
+            remaining(dict): "minute" & "day" requests left, None where there is no limit
+        """
+        with self._lock:
+            now = self.timefunc()
+            used_today = self._used_today if int(now // 86400) == self._day else 0
+            tokens = min(float(self.per_minute),
+                         self._tokens + (now - self._refilled) * self.per_minute / 60)
+            return {"minute": int(tokens) if self.per_minute else None,
+                    "day": self.per_day - used_today if self.per_day else None}
+
+#requests in progress, shared by covid_data_handler & covid_news_handling
+FLIGHTS = SingleFlight()
+
+#request budget of each upstream, newsapi keys on the free plan allow 100 requests a day.
+#Requests wait for the per minute limit, so a refresh of hundreds of areas is spread over a
+#few minutes instead of leaving the areas over the limit without data
+BUDGETS = {"covid": RateBudget(per_minute=100, max_wait=60),
+           "news": RateBudget(per_minute=10, per_day=100, max_wait=60)}
+
+def acquire(upstream: str) -> None:
+    """
+    uses up one request of an upstream's budget, waiting up to the budget's max_wait seconds
+    for its per minute limit
+
+    Parameters:
+        upstream(str): "covid" (the Cov19API) or "news" (the newsapi)
+
+    Returns:
+        None
+
+    Raises:
+        UpstreamBudgetError: if the budget is used up, the request must not be sent
+    """
+    budget = BUDGETS[upstream]
+    if not budget.try_acquire(budget.max_wait):
+        METRICS.inc("upstream_budget_exhausted_total", labels={"upstream": upstream})
+        raise UpstreamBudgetError(f"the request budget of the {upstream} upstream is used up")
+    METRICS.inc("upstream_requests_total", labels={"upstream": upstream})
+
+def configure_budgets(settings: Dict[str, Dict[str, float]]) -> None:
+    """
+    applies the "Upstream_budgets" settings from the config file
+
+    Parameters:
+        settings(dict): upstream -> {"per_minute": ..., "per_day": ..., "max_wait_seconds": ...},
+                        0 for no limit (or no waiting)
+
+    Returns:
+        None
+    """
+    for upstream, limits in settings.items():
+        if upstream not in BUDGETS:
+            print(f"Error: unknown upstream {upstream}, valid upstreams are: {list(BUDGETS)}")
+            continue
+        budget = BUDGETS[upstream]
+        budget.configure(float(limits.get("per_minute", budget.per_minute)),
+                         int(limits.get("per_day", budget.per_day)),
+                         float(limits.get("max_wait_seconds", budget.max_wait)))